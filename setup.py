@@ -15,9 +15,12 @@ setup(
     install_requires=[
         "regex",
         "mokuro",
+        "natsort",
         "ginza",
         "ja_ginza_electra",
         "ja_ginza",
+        "fugashi",
+        "unidic-lite",
         "pypdf",
         "ebooklib",
         "tqdm",
@@ -13,7 +13,7 @@ from .ocr import (
     process_json_file,
     extract_lines_from_data,
 )
-from .tokenizer import vocab_from_texts
+from .tokenizer import vocab_from_texts, tokens_from_texts, vocab_from_volumes
 from .main import (
     main,
     texts_from_manga,
@@ -24,6 +24,7 @@ from .main import (
     configure_logging,
     check_invalid_options,
 )
+from .chunker import chunk_texts
 from .csv import save_vocab_to_csv, process_vocab_file, combine_csvs
 from .pdf import texts_from_pdf
 from .epub import texts_from_epub
@@ -42,6 +43,8 @@ __all__ = [
     "process_json_file",
     "extract_lines_from_data",
     "vocab_from_texts",
+    "tokens_from_texts",
+    "vocab_from_volumes",
     "main",
     "texts_from_manga",
     "texts_from_generic_file",
@@ -50,6 +53,7 @@ __all__ = [
     "get_output_file_path",
     "configure_logging",
     "check_invalid_options",
+    "chunk_texts",
     "save_vocab_to_csv",
     "process_vocab_file",
     "combine_csvs",
@@ -167,11 +167,12 @@ b{color: #5586cd}"""
         return True
 
     def create_notes(self, deck_name, words, freq):
-        jamdict = dictionary.get_jamdict_instance()
         fails = []
-        log_file = open("logfile.log", "w", encoding="utf-8")
+        word_infos = {}
+        for pos in {pos for _, pos in words}:
+            word_infos[pos] = dictionary.get_word_infos([w for w, p in words if p == pos], pos)
         for word, pos in words:
-            word_info = dictionary.get_word_info(word, jamdict, log_file, pos)
+            word_info = word_infos[pos][word]
             try:
                 if not word_info["definition"]:
                     raise Exception(f"Word has no definitions")
@@ -203,8 +204,6 @@ b{color: #5586cd}"""
                 fails.append(word)
                 logging.error(f"Failed to add note {word}: {e}")
         logging.info(f"Created {len(words) - len(fails)} words, fails: {fails}")
-        log_file.flush()
-        log_file.close()
 
     def get_deck_names(self):
         if not self.check_connection():
@@ -1,6 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# Local application imports
+from . import trace
+
+
+def trace_subsystems(value: str) -> list[str]:
+    import argparse
+
+    try:
+        return trace.parse_subsystems(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
 
 def parse_arguments():
     """Parse command-line arguments."""
@@ -34,6 +46,31 @@ def parse_arguments():
         action="store_true",
         help="Add furigana to all words in the CSV file. Note that this is quite primitive, it just adds the reading of the whole word in hiragana in brackets.",
     )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Only relevant if processing a manga: tokenize each volume as soon as mokuro has finished it, while OCR continues on the remaining volumes. Most useful together with --parent.",
+    )
+    parser.add_argument(
+        "--ocr-backend",
+        type=str,
+        required=False,
+        default="inprocess",
+        choices=["inprocess", "subprocess"],
+        help="Only relevant if processing a manga: 'inprocess' (default) runs mokuro inside this program and loads its models once for all volumes, falling back to the mokuro command if that is not possible. 'subprocess' always runs the mokuro command.",
+    )
+    parser.add_argument(
+        "--ocr-threads",
+        type=int,
+        required=False,
+        default=None,
+        help="Only relevant if processing a manga: number of CPU threads used by the in-process OCR models. Defaults to all cores. The limit applies to this whole process while OCR runs, so with --pipeline and --workers 1 it also limits tokenization until OCR is done.",
+    )
+    parser.add_argument(
+        "--skip-blank-pages",
+        action="store_true",
+        help="Only relevant if processing a manga: do not OCR pages that are blank or duplicate scans of an earlier page of the same volume. Needs numpy and Pillow.",
+    )
     parser.add_argument(
         "--freq-order",
         action="store_true",
@@ -66,12 +103,78 @@ def parse_arguments():
         default="",
         help="Path to file with Bunpro known words. One word per line."
     )
+    parser.add_argument(
+        "--freq-dict",
+        type=str,
+        required=False,
+        default="input",
+        help="Yomitan frequency dictionary used for word frequencies: the dictionary zip, a folder with its term_meta_bank_*.json files or a single JSON file. Default is the 'input' folder in the current directory.",
+    )
+    parser.add_argument(
+        "--build-dict-index",
+        action="store_true",
+        help="Compile JMdict and the frequency dictionary into a fast lookup index before processing. Only needed once (and again after changing --freq-dict), later runs use the index automatically.",
+    )
+    parser.add_argument(
+        "--no-dict-cache",
+        action="store_true",
+        help="Do not read or write the on-disk cache of dictionary lookups (~/.cache/jve-word-info-cache).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        required=False,
+        default=256,
+        help="Number of texts the tokenizer processes per batch. Larger batches are faster but use more memory. Default is 256.",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        required=False,
+        default="electra",
+        choices=["electra", "ginza", "fugashi"],
+        help="Tokenizer used to split the text into words. 'electra' (default) is the most accurate and the slowest, 'ginza' uses the lighter GiNZA model, 'fugashi' uses plain UniDic morphological analysis and is by far the fastest, at some cost in accuracy.",
+    )
+    parser.add_argument(
+        "--no-token-cache",
+        action="store_true",
+        help="Do not read or write the on-disk tokenization cache (~/.cache/jve-token-cache). By default, text that was tokenized in an earlier run is not tokenized again.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of worker processes used for tokenization. Each worker loads its own copy of the language model, so memory usage grows with this number. Default is 1. Also sets the number of processes extracting PDF text.",
+    )
+    parser.add_argument(
+        "--csv-workers",
+        type=int,
+        required=False,
+        default=None,
+        help="Number of threads or processes (see --executor) that enrich the CSV files with dictionary data. Defaults to one per CPU.",
+    )
+    parser.add_argument(
+        "--executor",
+        type=str,
+        required=False,
+        default="thread",
+        choices=["thread", "process"],
+        help="How CSV files are enriched with dictionary data in parallel. 'thread' (default) shares one dictionary between threads, 'process' runs worker processes that each open their own dictionary and scales better with many CSV files.",
+    )
     parser.add_argument(
         '--debug',
         action="store_true",
         required=False,
         default=False,
-        help="Print debugging information. Default is False.",
+        help="Print debugging information and write detailed traces of all subsystems to trace.<subsystem>.<pid>.log. Default is False.",
+    )
+    parser.add_argument(
+        "--trace",
+        type=trace_subsystems,
+        required=False,
+        default=None,
+        help=f"Comma-separated list of subsystems to write detailed traces for ({', '.join(trace.subsystems)}, or all), with or without --debug. Tracing is off without this option or --debug.",
     )
     parser.add_argument(
         "--wk-key",
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+from typing import Iterable, Iterator
+
+import regex as re
+
+# Small enough for Sudachi's input limit and the transformer window, large enough to keep nlp.pipe batches busy
+DEFAULT_MAX_CHUNK_CHARS = 1000
+
+# Split after a run of sentence-ending punctuation and closing quotes ("元気？」と" splits after the quote),
+# and on line breaks
+sentence_boundary_pattern = re.compile(r"(?<=[。！？」』])(?![。！？」』])|\n")
+clause_boundary_pattern = re.compile(r"[、，,\s]")
+
+
+def split_sentences(text: str) -> Iterator[str]:
+    for sentence in sentence_boundary_pattern.split(text):
+        sentence = sentence.strip()
+        if sentence:
+            yield sentence
+
+
+def split_long_sentence(sentence: str, max_chars: int) -> Iterator[str]:
+    """Cut a sentence that does not fit in one chunk, preferring the last clause boundary before the limit."""
+    while len(sentence) > max_chars:
+        cut = max_chars
+        for match in clause_boundary_pattern.finditer(sentence, 0, max_chars):
+            cut = match.end()
+        yield sentence[:cut]
+        sentence = sentence[cut:]
+    if sentence:
+        yield sentence
+
+
+def chunk_texts(texts: Iterable[str], max_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> Iterator[str]:
+    """
+    Normalize texts of any granularity (whole PDF pages, EPUB fragments, single OCR lines) into chunks of
+    whole sentences of at most max_chars characters, joined by line breaks.
+    """
+    for chunk, _ in chunk_counted_lines(((text, 1) for text in texts), max_chars):
+        yield chunk
+
+
+def chunk_counted_lines(
+        lines: Iterable[tuple[str, int]], max_chars: int = DEFAULT_MAX_CHUNK_CHARS
+) -> Iterator[tuple[str, int]]:
+    """
+    Like chunk_texts, for lines that carry a multiplicity. Only neighbouring lines with the same multiplicity
+    share a chunk, so every chunk can be counted with a single weight.
+    """
+    buffer = []
+    size = 0
+    buffer_count = None
+    for text, count in lines:
+        for sentence in split_sentences(text):
+            for piece in split_long_sentence(sentence, max_chars):
+                if buffer and (size + len(piece) > max_chars or count != buffer_count):
+                    yield "\n".join(buffer), buffer_count
+                    buffer = []
+                    size = 0
+                buffer.append(piece)
+                buffer_count = count
+                size += len(piece) + 1
+    if buffer:
+        yield "\n".join(buffer), buffer_count
@@ -3,13 +3,20 @@
 
 # Standard Library Imports
 import csv
+import itertools
 import logging
+import os
+import shutil
+import tempfile
 from pathlib import Path
 import regex as re
 
 # Local imports
 from . import dictionary
 
+# Rows enriched per batch of dictionary lookups
+VOCAB_CHUNK_SIZE = 1000
+
 
 def save_vocab_to_csv(vocab: list, output_file: Path):
     with open(output_file, "w", newline="", encoding="utf-8") as file:
@@ -19,98 +26,117 @@ def save_vocab_to_csv(vocab: list, output_file: Path):
             writer.writerow([word])
 
 
-def process_vocab_file(
-    vocab_file: Path, add_english: bool, add_furigana: bool, id: bool
-):
-    jamdict = dictionary.get_jamdict_instance()
-
-    updated_rows = []
-    log_file = open("logfile.log", "w", encoding="utf-8")
+def read_vocab_words(vocab_file: Path) -> list[str]:
     with open(vocab_file, "r", newline="", encoding="utf-8") as file:
         reader = csv.reader(file)
-        headers = next(reader)
-        if add_english:
-            headers.append("definition")
-        updated_rows.append(headers)
-
-        for row in reader:
-            word = row[0]
-            word_info = dictionary.get_word_info(word, jamdict, log_file)
-
-            # I currently decided one-letter kana words are not worth keeping in
-            # because the definitions fetched for them are absolutely useless. This could
-            # and should definitely be changed but I'm not really sure how to do it.
-            one_character_kana = re.match(r"^\p{Hiragana}$|^\p{Katakana}$", word)
-            if not word_info["is_real"] or (one_character_kana and add_english):
-                logging.debug(f"Removing {word}")
-                continue
+        next(reader)
+        return [row[0] for row in reader if row]
 
-            # Add English definition
+
+def process_vocab_file(
+    vocab_file: Path, add_english: bool, add_furigana: bool, id: bool, chunk_size: int = VOCAB_CHUNK_SIZE
+):
+    """
+    Enrich the vocab CSV in place, chunk_size rows at a time, so memory stays flat for large libraries.
+    Rows go to a temporary file next to it that replaces the original only once it is complete.
+    """
+    temp_file = tempfile.NamedTemporaryFile(
+        "w", newline="", encoding="utf-8", dir=vocab_file.parent, prefix=f".{vocab_file.name}.", delete=False
+    )
+    try:
+        with open(vocab_file, "r", newline="", encoding="utf-8") as file, temp_file:
+            reader = csv.reader(file)
+            writer = csv.writer(temp_file)
+            headers = next(reader)
             if add_english:
-                row.append(word_info["definition"])
+                headers.append("definition")
+            writer.writerow(headers)
+
+            for rows in itertools.batched(reader, chunk_size):
+                word_infos = dictionary.get_word_infos([row[0] for row in rows])
+                writer.writerows(enrich_rows(rows, word_infos, add_english, add_furigana, id))
+        shutil.copymode(vocab_file, temp_file.name)
+        os.replace(temp_file.name, vocab_file)
+    except BaseException:
+        # Leave the original untouched
+        os.remove(temp_file.name)
+        raise
+
+
+def enrich_rows(rows, word_infos: dict[str, dict], add_english: bool, add_furigana: bool, id: bool):
+    for row in rows:
+        row = list(row)
+        word = row[0]
+        word_info = word_infos[word]
+
+        # I currently decided one-letter kana words are not worth keeping in
+        # because the definitions fetched for them are absolutely useless. This could
+        # and should definitely be changed but I'm not really sure how to do it.
+        one_character_kana = re.match(r"^\p{Hiragana}$|^\p{Katakana}$", word)
+        if not word_info["is_real"] or (one_character_kana and add_english):
+            logging.debug(f"Removing {word}")
+            continue
+
+        # Add English definition
+        if add_english:
+            row.append(word_info["definition"])
 
-            # Add furigana
-            if add_furigana and re.search(r"\p{Han}", word):
-                row[0] = f"{word} ({word_info['kana']})"
+        # Add furigana
+        if add_furigana and re.search(r"\p{Han}", word):
+            row[0] = f"{word} ({word_info['kana']})"
 
-            # Replace with ID if desired
-            if id:
-                row[0] = word_info["id"]
+        # Replace with ID if desired
+        if id:
+            row[0] = word_info["id"]
 
-            updated_rows.append(row)
-
-    with open(vocab_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-        writer.writerows(updated_rows)
-    log_file.flush()
-    log_file.close()
+        yield row
 
 
 def combine_csvs(csv_files: list[Path]) -> Path:
-    new_rows = []
-
-    # Add header
+    """
+    Write vocab_combined.csv: every CSV in file name order under a "#<name>" chapter row, keeping only the
+    first occurrence of each word and dropping chapters left without words. Rows are streamed straight
+    to the output, so this takes linear time and constant memory apart from the set of seen words.
+    """
+    # Header
     with open(csv_files[0], "r", newline="", encoding="utf-8") as file:
         reader = csv.reader(file)
         header = next(reader)
-        new_rows.append(header)
 
     # Sort csv files by file name
     csv_files.sort(key=lambda x: x.stem)
 
-    # Add chapters
+    output_file = csv_files[0].parent / "vocab_combined.csv"
+    with open(output_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        # A chapter row is only written once the next row shows the chapter is not empty
+        pending_chapter = None
+        for row in unique_rows(combined_rows(header, csv_files)):
+            if row[0].startswith("#"):
+                pending_chapter = row
+                continue
+            if pending_chapter is not None:
+                writer.writerow(pending_chapter)
+                pending_chapter = None
+            writer.writerow(row)
+
+    return output_file
+
+
+def combined_rows(header: list[str], csv_files: list[Path]):
+    yield header
     for csv_file in csv_files:
         with open(csv_file, "r", newline="", encoding="utf-8") as file:
             reader = csv.reader(file)
-            new_rows.append(["#" + csv_file.stem.replace("vocab_", "")])
-            new_rows.extend(list(reader)[1:])
+            next(reader, None)
+            yield ["#" + csv_file.stem.replace("vocab_", "")]
+            yield from reader
 
-    # Remove all duplicates while preserving order
-    known_words = set()
-    i = 0
-    while i < len(new_rows):
-        if new_rows[i][0] in known_words:
-            new_rows.pop(i)
-            i -= 1
-        else:
-            known_words.add(new_rows[i][0])
-        i += 1
-
-    # Remove all empty chapters (chapters followed immediately by another chapter)
-    i = 0
-    while i < len(new_rows) - 1:
-        if new_rows[i][0].startswith("#") and new_rows[i + 1][0].startswith("#"):
-            new_rows.pop(i)
-            i -= 1
-        i += 1
-    if new_rows[-1][0].startswith("#"):
-        new_rows.pop(-1)
-
-    # Write file
-    with open(
-        csv_files[0].parent / "vocab_combined.csv", "w", newline="", encoding="utf-8"
-    ) as file:
-        writer = csv.writer(file)
-        writer.writerows(new_rows)
 
-    return csv_files[0].parent / "vocab_combined.csv"
+def unique_rows(rows):
+    """Drop every row whose first cell was seen before, chapter rows and the header included."""
+    known_words = set()
+    for row in rows:
+        if row[0] not in known_words:
+            known_words.add(row[0])
+            yield row
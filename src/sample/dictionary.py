@@ -1,36 +1,174 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import functools
+import hashlib
+import io
 import json
 # Standard Library Imports
 import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import regex as re
 from jamdict import Jamdict
 import sys
-from collections import defaultdict
+
+from . import trace
+
+# Folder, Yomitan zip or term_meta_bank JSON file with the frequency data, relative to the working directory
+DEFAULT_FREQUENCY_BANK_PATH = Path("input")
+
+term_meta_bank_pattern = re.compile(r"^term_meta_bank_(\d+)\.json$")
+digits_pattern = re.compile(r"\d+")
+
 
 class Dictionary(object):
-    def __init__(self):
-        self.term_meta_bank = defaultdict(list)
-        with open('./input/term_meta_bank_1.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(data[0])
-            for entry in data:
-                word = entry[0]
-                # if word in self.term_meta_bank:
-                #     print(f'Duplicate term {word} in vocabulary')
-                data = entry[2]
-                if "frequency" in data:
-                    self.term_meta_bank[word].append(data["frequency"]["displayValue"])
-                else:
-                    self.term_meta_bank[word].append(data["displayValue"])
-
-    def find_term(self, term):
-        return self.term_meta_bank.get(term, [])
+    """
+    Yomitan frequency bank. Loaded on the first lookup from every term_meta_bank_N.json found in a folder,
+    a Yomitan dictionary zip or a single JSON file, with each frequency stored once as (display value, number).
+    """
+
+    def __init__(self, path: Path = DEFAULT_FREQUENCY_BANK_PATH):
+        self.path = Path(path)
+        self._term_meta_bank = None
+        self._lock = threading.Lock()
+
+    @property
+    def term_meta_bank(self) -> dict[str, tuple[tuple[str, int], ...]]:
+        if self._term_meta_bank is None:
+            # CSV workers look words up from several threads, only one of them should load the bank
+            with self._lock:
+                if self._term_meta_bank is None:
+                    self._term_meta_bank = self.load()
+        return self._term_meta_bank
+
+    def load(self) -> dict[str, tuple[tuple[str, int], ...]]:
+        term_meta_bank = {}
+        sources = list(self.sources())
+        if not sources:
+            logging.warning(f"No frequency dictionary found at {self.path.absolute()}, frequencies will be empty.")
+            return term_meta_bank
+        for name, open_source in sources:
+            logging.debug(f"Loading frequency data from {name}")
+            with open_source() as f:
+                for entry in iter_json_array(f):
+                    word = entry[0]
+                    frequency = parse_frequency(entry[2])
+                    term_meta_bank[word] = term_meta_bank.get(word, ()) + (frequency,)
+        logging.debug(f"Loaded frequencies for {len(term_meta_bank)} terms")
+        return term_meta_bank
+
+    def sources(self):
+        """Yield (name, opener) for every term meta bank file, in bank order."""
+        if self.path.is_file() and zipfile.is_zipfile(self.path):
+            archive = zipfile.ZipFile(self.path)
+            for name in sorted_term_meta_banks(archive.namelist()):
+                yield name, functools.partial(open_zip_member, archive, name)
+        elif self.path.is_file():
+            yield self.path.name, functools.partial(open, self.path, "r", encoding="utf-8")
+        elif self.path.is_dir():
+            for name in sorted_term_meta_banks(child.name for child in self.path.iterdir()):
+                yield name, functools.partial(open, self.path / name, "r", encoding="utf-8")
+
+    def signature(self) -> list:
+        """Identifies the frequency data on disk, so compiled indexes can tell when it changed."""
+        if self.path.is_dir():
+            files = [self.path / name for name in sorted_term_meta_banks(child.name for child in self.path.iterdir())]
+        elif self.path.is_file():
+            files = [self.path]
+        else:
+            files = []
+        return [[file.absolute().as_posix(), file.stat().st_size, file.stat().st_mtime_ns] for file in files]
+
+    def find_term(self, term) -> list[str]:
+        return [display for display, _ in self.term_meta_bank.get(term, ())]
+
+    def find_kana_frequencies(self, term) -> list[int]:
+        """Frequencies of the term when written in kana, marked with ㋕ in the display value."""
+        return [number for display, number in self.term_meta_bank.get(term, ()) if '㋕' in display]
+
+
+def open_zip_member(archive: zipfile.ZipFile, name: str):
+    return io.TextIOWrapper(archive.open(name), encoding="utf-8")
+
+
+def sorted_term_meta_banks(names) -> list[str]:
+    banks = []
+    for name in names:
+        match = term_meta_bank_pattern.match(name)
+        if match:
+            banks.append((int(match.group(1)), name))
+    return [name for _, name in sorted(banks)]
+
+
+def parse_frequency(data) -> tuple[str, int]:
+    """Turn a Yomitan frequency entry into (display value, number), e.g. "1234㋕" -> ("1234㋕", 1234)."""
+    if isinstance(data, dict) and "frequency" in data:
+        data = data["frequency"]
+    if isinstance(data, dict):
+        value = data.get("value", 0)
+        display = str(data.get("displayValue", value))
+    else:
+        value = data
+        display = str(data)
+    digits = digits_pattern.search(display)
+    return display, int(digits.group()) if digits else int(value)
+
+
+def iter_json_array(stream, chunk_size: int = 1 << 16):
+    """Yield the elements of a top-level JSON array one by one, without reading the whole file into memory."""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size)
+    eof = not buffer
+    position = 0
+
+    def skip(chars):
+        nonlocal position
+        while position < len(buffer) and buffer[position] in chars:
+            position += 1
+
+    skip(" \t\r\n\ufeff")
+    if buffer[position:position + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    while True:
+        skip(" \t\r\n,")
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("Need more data", buffer, position)
+            element, end = decoder.raw_decode(buffer, position)
+            # A value ending exactly at the end of the buffer (e.g. a number) might continue in the next chunk
+            if end == len(buffer) and not eof:
+                raise json.JSONDecodeError("Need more data", buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = stream.read(chunk_size)
+            eof = not more
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield element
+        position = end
 
 
 lookup_dict = Dictionary()
 
 
+def set_frequency_bank_path(path: Path) -> None:
+    global lookup_dict
+    lookup_dict = Dictionary(path)
+
+
 # todo filter by pos
 # filter by freq
 # filter by archaik/rare?
@@ -43,6 +181,260 @@ def get_jamdict_instance():
     return jam
 
 
+class DictionaryService(object):
+    """
+    One in-memory Jamdict shared by every thread of the process. Its SQLite database can only be used from
+    the thread that created it, so lookups run on a dedicated dictionary thread while callers wait for them.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jamdict")
+        # Held in thread-local storage so it is also released on the dictionary thread when that exits
+        self._local = threading.local()
+        self._executor.submit(self._load).result()
+
+    def _load(self):
+        self._local.jam = get_jamdict_instance()
+
+    def _lookup(self, word):
+        # Only the word entries are used, skip the kanji character and named entity lookups
+        return self._local.jam.lookup(word, lookup_chars=False, lookup_ne=False)
+
+    def lookup(self, word):
+        return self._executor.submit(self._lookup, word).result()
+
+
+_lookup_instance = None
+_lookup_instance_pid = None
+_lookup_instance_lock = threading.Lock()
+
+
+def get_lookup_instance():
+    """
+    The process-wide dictionary shared by all CSV workers and the Anki export: the compiled index if it is
+    built and up to date, a DictionaryService around Jamdict otherwise. Created on first use.
+    """
+    global _lookup_instance, _lookup_instance_pid
+    with _lookup_instance_lock:
+        # A forked worker process does not inherit the dictionary thread, so it needs its own instance
+        if _lookup_instance is None or _lookup_instance_pid != os.getpid():
+            _lookup_instance = open_dictionary_index() or DictionaryService()
+            _lookup_instance_pid = os.getpid()
+    return _lookup_instance
+
+
+# POS filters get_word_info is called with: none for CSVs, the lowercased tokenizer.included_pos for Anki
+kana_table_pos = ["", "noun", "verb", "pron", "adj", "adv", "cconj"]
+
+DEFAULT_INDEX_PATH = Path.home() / ".cache" / "jve-dict-index" / "jmdict.idx"
+INDEX_MAGIC = b"JVEIDX01"
+# header: magic, meta length, key count, entry count
+index_header = struct.Struct("<8sIII")
+# key table row: key offset, key length, record offset, record length
+index_key_row = struct.Struct("<IIII")
+# entry table row: entry offset, entry length
+index_entry_row = struct.Struct("<II")
+
+
+class IndexForm(object):
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+
+class IndexSense(object):
+    __slots__ = ("pos", "gloss")
+
+    def __init__(self, pos, gloss):
+        self.pos = pos
+        self.gloss = gloss
+
+    def text(self):
+        return '/'.join(self.gloss)
+
+    def __repr__(self):
+        return self.text()
+
+
+class IndexEntry(object):
+    """The parts of a JMdict entry get_word_info reads, with the same attribute names as jamdict's JMDEntry."""
+    __slots__ = ("idseq", "kanji_forms", "kana_forms", "senses")
+
+    def __init__(self, idseq, kanji_forms, kana_forms, senses):
+        self.idseq = idseq
+        self.kanji_forms = [IndexForm(text) for text in kanji_forms]
+        self.kana_forms = [IndexForm(text) for text in kana_forms]
+        self.senses = [IndexSense(pos, gloss) for pos, gloss in senses]
+
+    def __repr__(self):
+        return f"{self.kana_forms[0].text if self.kana_forms else ''} ({self.kanji_forms[0].text if self.kanji_forms else ''})"
+
+
+class IndexLookupResult(object):
+    __slots__ = ("entries", "kana_choices")
+
+    def __init__(self, entries, kana_choices):
+        self.entries = entries
+        # POS -> position in entries of the entry choose_kana_entry picked when the index was built, -1 for none
+        self.kana_choices = kana_choices
+
+    def kana_choice(self, pos: str):
+        choice = self.kana_choices[pos]
+        return self.entries[choice] if choice >= 0 else None
+
+
+class DictionaryIndex(object):
+    """
+    Read-only, memory-mapped JMdict + frequency bank index built by build_dictionary_index.
+    Keys are kept in a sorted table that is binary searched in place, so processes using the same index
+    share its pages and lookups never touch SQLite.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_length, self.key_count, self.entry_count = index_header.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a dictionary index")
+        meta_start = index_header.size
+        self.meta = json.loads(self.data[meta_start:meta_start + meta_length])
+        self.key_table = meta_start + meta_length
+        self.entry_table = self.key_table + self.key_count * index_key_row.size
+        self.blobs = self.entry_table + self.entry_count * index_entry_row.size
+
+    def _key_at(self, i: int) -> tuple[bytes, int, int]:
+        key_offset, key_length, record_offset, record_length = index_key_row.unpack_from(
+            self.data, self.key_table + i * index_key_row.size
+        )
+        start = self.blobs + key_offset
+        return self.data[start:start + key_length], record_offset, record_length
+
+    def record(self, word: str) -> dict:
+        key = word.encode("utf-8")
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.key_count:
+            return {}
+        found, record_offset, record_length = self._key_at(low)
+        if found != key:
+            return {}
+        start = self.blobs + record_offset
+        return json.loads(self.data[start:start + record_length])
+
+    def entry(self, i: int) -> IndexEntry:
+        entry_offset, entry_length = index_entry_row.unpack_from(self.data, self.entry_table + i * index_entry_row.size)
+        start = self.blobs + entry_offset
+        return IndexEntry(*json.loads(self.data[start:start + entry_length]))
+
+    def lookup(self, word: str) -> IndexLookupResult:
+        record = self.record(word)
+        return IndexLookupResult([self.entry(i) for i in record.get("e", [])], record.get("k", {}))
+
+    def find_term(self, term) -> list[str]:
+        return [display for display, _ in self.record(term).get("f", [])]
+
+    def find_kana_frequencies(self, term) -> list[int]:
+        return [number for display, number in self.record(term).get("f", []) if '㋕' in display]
+
+
+def dictionary_signature(jam) -> dict:
+    db_file = Path(jam.db_file)
+    return {
+        "format": 2,
+        "jamdict_db": [db_file.absolute().as_posix(), db_file.stat().st_size, db_file.stat().st_mtime_ns],
+        "frequency_bank": lookup_dict.signature(),
+    }
+
+
+def build_dictionary_index(path: Path = DEFAULT_INDEX_PATH, jam=None) -> Path:
+    """
+    Compile every JMdict entry and the frequency bank into a memory-mappable index. Entries are keyed by
+    each of their kanji and kana forms, in the same order a Jamdict lookup returns them.
+    """
+    if jam is None:
+        jam = Jamdict()
+    logging.info("Building dictionary index, this takes a few minutes...")
+    entries = []
+    records = {}
+    with sqlite3.connect(jam.db_file) as connection:
+        idseqs = [idseq for (idseq,) in connection.execute("SELECT idseq FROM Entry")]
+    with jam.jmdict.ctx() as ctx:
+        for i, idseq in enumerate(idseqs):
+            entry = jam.jmdict.get_entry(idseq, ctx=ctx)
+            entries.append([
+                entry.idseq,
+                [form.text for form in entry.kanji_forms],
+                [form.text for form in entry.kana_forms],
+                [[list(sense.pos), [str(gloss) for gloss in sense.gloss]] for sense in entry.senses],
+            ])
+            for text in dict.fromkeys([form.text for form in entry.kanji_forms + entry.kana_forms]):
+                records.setdefault(text, {}).setdefault("e", []).append(i)
+    for term, frequencies in lookup_dict.term_meta_bank.items():
+        records.setdefault(term, {})["f"] = [list(frequency) for frequency in frequencies]
+
+    # Disambiguating a kana word walks all its entries, senses and kanji forms, so do it once here
+    for key, record in records.items():
+        if "e" not in record or not hiragana_only_pattern.match(key):
+            continue
+        key_entries = [IndexEntry(*entries[i]) for i in record["e"]]
+        record["k"] = {}
+        for pos in kana_table_pos:
+            best_entry = choose_kana_entry(key, key_entries, pos, lookup_dict)
+            record["k"][pos] = key_entries.index(best_entry) if best_entry is not None else -1
+
+    keys = sorted(records, key=lambda key: key.encode("utf-8"))
+    meta = json.dumps(dictionary_signature(jam)).encode("utf-8")
+    blob = bytearray()
+    key_table = bytearray()
+    entry_table = bytearray()
+    for entry in entries:
+        encoded = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        entry_table += index_entry_row.pack(len(blob), len(encoded))
+        blob += encoded
+    for key in keys:
+        encoded_key = key.encode("utf-8")
+        encoded_record = json.dumps(records[key], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        key_table += index_key_row.pack(len(blob), len(encoded_key), len(blob) + len(encoded_key), len(encoded_record))
+        blob += encoded_key + encoded_record
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(index_header.pack(INDEX_MAGIC, len(meta), len(keys), len(entries)))
+        f.write(meta)
+        f.write(key_table)
+        f.write(entry_table)
+        f.write(blob)
+    os.replace(temp_path, path)
+    logging.info(f"Dictionary index with {len(keys)} keys saved to {path}")
+    return path
+
+
+def open_dictionary_index(path: Path = DEFAULT_INDEX_PATH):
+    """Open the compiled index, or return None if it was not built or the dictionaries changed since."""
+    if not path.is_file():
+        return None
+    try:
+        index = DictionaryIndex(path)
+    except (ValueError, OSError) as e:
+        logging.warning(f"Could not open dictionary index {path}: {e}")
+        return None
+    if index.meta != dictionary_signature(Jamdict()):
+        logging.warning("Dictionary index is out of date, rebuild it with --build-dict-index. Using Jamdict instead.")
+        return None
+    return index
+
+
 def print_jmdict_object(obj, indent=0, visited=None, output_file=sys.stdout):
     """
     Recursively print the attributes of a Jamdict/JMDict object as a tree.
@@ -85,78 +477,206 @@ def print_jmdict_object(obj, indent=0, visited=None, output_file=sys.stdout):
 hiragana_only_pattern = re.compile(r"[\p{IsHiragana}]+")
 
 
-def get_word_info(word: str, jam, log_file=sys.stdout, pos="") -> dict:
+def choose_kana_entry(word: str, entries, pos: str, frequencies):
+    """
+    Pick the entry a hiragana word most likely stands for: among the entries with a sense matching pos,
+    the one whose kanji forms are most frequently written in kana.
+    """
+    tracing = trace.enabled("dictionary")
+    best_entry = None
+    min_frequency = None
+    kana_frequencies = {}
+    for entry in entries:
+        for sense in entry.senses:
+            # pos check
+            filtered_pos = sense.pos
+            if pos:
+                filtered_pos = [x for x in sense.pos if pos in x]
+            if not len(filtered_pos):
+                if tracing:
+                    trace.emit("dictionary", f"No pos found for {entry}, given pos={pos}")
+                continue
+            for kanji_form in entry.kanji_forms:
+                # Every sense of an entry looks at the same kanji forms, look their frequencies up once
+                if kanji_form.text not in kana_frequencies:
+                    kana_frequencies[kanji_form.text] = frequencies.find_kana_frequencies(kanji_form.text)
+                normalized_kana_freq = kana_frequencies[kanji_form.text]
+                if tracing:
+                    trace.emit("dictionary", f"{kanji_form} normalized_kana_freq: {normalized_kana_freq}")
+                if not len(normalized_kana_freq):
+                    if tracing:
+                        trace.emit("dictionary", f"No kana freq data, skipping {kanji_form}")
+                    continue
+                freq = min(normalized_kana_freq)
+                if not min_frequency:
+                    min_frequency = freq
+                    best_entry = entry
+                elif freq < min_frequency:
+                    min_frequency = freq
+                    best_entry = entry
+            if not len(entry.kanji_forms):
+                normalized_kana_freq = frequencies.find_kana_frequencies(word)
+                if len(normalized_kana_freq):
+                    min_frequency = min(normalized_kana_freq)
+                    best_entry = entry
+            if tracing:
+                trace.emit("dictionary", f"Sense glosses: {sense.gloss}")
+                trace.emit("dictionary", f"Sense POS tags: {sense.pos}")
+        if tracing:
+            trace.emit("dictionary", f"Current best frequency: {min_frequency}, best sense: {best_entry}")
+            trace.emit("dictionary", "****************")
+    return best_entry
+
+
+def get_word_info(word: str, jam, pos="") -> dict:
+    tracing = trace.enabled("dictionary")
     result = jam.lookup(word)
-    print(f"-----word: {word}-------freq: {lookup_dict.find_term(word)}", file=log_file)
-    # if word == "まま":
-    #     with open("jmdict_debug.txt", "w", encoding="utf-8") as f:
-    #         print(f"=== Jamdict Lookup Tree for '{word}' ===\n", file=f)
-    #         for i, entry in enumerate(result.entries):
-    #             print(f"\n--- Entry #{i + 1} ---", file=f)
-    #             print_jmdict_object(entry, output_file=f)
-    # print(f"-----***-------")
+    # A compiled index carries its own copy of the frequency bank
+    frequencies = jam if isinstance(jam, DictionaryIndex) else lookup_dict
+    if tracing:
+        trace.emit("dictionary", f"-----word: {word}-------freq: {frequencies.find_term(word)}")
     if len(result.entries) == 0:
         return {"definition": "", "kana": "", "is_real": False, "id": "", "frequency": ""}
     pos = pos.lower()
     if hiragana_only_pattern.match(word):
         #     choose better fitting
-        best_entry = None
-        min_frequency = None
-        for entry in result.entries:
-            for sense in entry.senses:
-                # pos check
-                filtered_pos = sense.pos
-                if pos:
-                    filtered_pos = [x for x in sense.pos if pos in x]
-                if not len(filtered_pos):
-                    print(f"No pos found for {entry}, given pos={pos}", file=log_file)
-                    continue
-                for kanji_form in entry.kanji_forms:
-                    freq_list = lookup_dict.find_term(kanji_form.text)
-                    normalized_kana_freq = [int(re.search(r'\d+', x).captures()[0]) for x in freq_list if '㋕' in x]
-                    print(f"{kanji_form} freq_list={freq_list}, normalized_kana_freq: {normalized_kana_freq}", file=log_file)
-                    if not len(normalized_kana_freq):
-                        print(f"No kana freq data, skipping {kanji_form}", file=log_file)
-                        continue
-                    freq = min(normalized_kana_freq)
-                    if not min_frequency:
-                        min_frequency = freq
-                        best_entry = entry
-                    elif freq < min_frequency:
-                        min_frequency = freq
-                        best_entry = entry
-                    print(f"Kanji form: {kanji_form.text} frequency: {freq_list}", file=log_file)
-                if not len(entry.kanji_forms):
-                    freq_list = lookup_dict.find_term(word)
-                    normalized_kana_freq = [int(re.search(r'\d+', x).captures()[0]) for x in freq_list if '㋕' in x]
-                    if len(normalized_kana_freq):
-                        min_frequency = min(normalized_kana_freq)
-                        best_entry = entry
-                print("Sense glosses:", sense.gloss, file=log_file)
-                print("Sense POS tags:", sense.pos, file=log_file)  # <-- Here are the POS tags
-            for kana_forms in entry.kana_forms:
-                print(f"Kana form: {kana_forms.text} frequency: {lookup_dict.find_term(kana_forms.text)}", file=log_file)
-            print(f"Current best frequency: {min_frequency}, best sense: {best_entry}", file=log_file)
-            print("****************", file=log_file)
-        # if not best_entry:
-        #     print(f"No best entry candidate") #, choosing first from {len(result.entries)} entries", file=log_file)
-            # best_entry = result.entries[0]
-        print('Chosen sense:', best_entry, file=log_file)
-        definitions = best_entry
+        if pos in getattr(result, "kana_choices", {}):
+            definitions = result.kana_choice(pos)
+        else:
+            definitions = choose_kana_entry(word, result.entries, pos, frequencies)
+        if tracing:
+            trace.emit("dictionary", f"Chosen sense: {definitions}")
     else:
         definitions = result.entries[0]
     if not definitions:
-        print(f"No definitions found for {word}", file=log_file)
-        print("---------------", file=log_file)
+        if tracing:
+            trace.emit("dictionary", f"No definitions found for {word}")
+            trace.emit("dictionary", "---------------")
         return {"definition": "", "kana": "", "is_real": False, "id": "", "frequency": ""}
 
     definition_text = ", ".join(' / '.join(sense.text().split('/')) for sense in definitions.senses[:3])
     kana_text = definitions.kana_forms[0].text
-    print("---------------", file=log_file)
+    if tracing:
+        trace.emit("dictionary", "---------------")
     return {
         "definition": definition_text,
         "kana": kana_text,
         "is_real": True,
         "id": definitions.idseq,
-        "frequency": " / ".join(lookup_dict.find_term(word)),
+        "frequency": " / ".join(frequencies.find_term(word)),
     }
+
+
+# Bump whenever get_word_info changes what it returns, to invalidate persisted results
+WORD_INFO_VERSION = 1
+WORD_INFO_MEMO_SIZE = 100_000
+
+_word_info_memo = OrderedDict()
+_word_info_memo_lock = threading.Lock()
+
+
+class WordInfoCache(object):
+    """Persistent get_word_info results in ~/.cache/jve-word-info-cache, keyed by dictionary version, word and POS."""
+
+    def __init__(self, path: Path = None):
+        if path is None:
+            cache_root = Path.home() / ".cache" / "jve-word-info-cache"
+            cache_root.mkdir(parents=True, exist_ok=True)
+            path = cache_root / "word_info.sqlite3"
+        # Shared by the CSV worker threads, access is serialized by the lock
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS word_info "
+                "(version TEXT NOT NULL, word TEXT NOT NULL, pos TEXT NOT NULL, info TEXT NOT NULL, "
+                "PRIMARY KEY (version, word, pos))"
+            )
+            self.connection.commit()
+        self.version = dictionary_version()
+
+    def get_many(self, words, pos: str) -> dict[str, dict]:
+        found = {}
+        with self.lock:
+            for word in words:
+                row = self.connection.execute(
+                    "SELECT info FROM word_info WHERE version = ? AND word = ? AND pos = ?", (self.version, word, pos)
+                ).fetchone()
+                if row is not None:
+                    found[word] = json.loads(row[0])
+        return found
+
+    def put_many(self, infos: dict[str, dict], pos: str) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO word_info (version, word, pos, info) VALUES (?, ?, ?, ?)",
+                [(self.version, word, pos, json.dumps(info, ensure_ascii=False)) for word, info in infos.items()],
+            )
+            self.connection.commit()
+
+
+def dictionary_version() -> str:
+    signature = dictionary_signature(Jamdict())
+    signature["word_info"] = WORD_INFO_VERSION
+    return hashlib.sha256(json.dumps(signature).encode("utf-8")).hexdigest()
+
+
+_word_info_cache = None
+_word_info_cache_pid = None
+_use_word_info_cache = True
+
+
+def set_word_info_cache_enabled(enabled: bool) -> None:
+    global _use_word_info_cache
+    _use_word_info_cache = enabled
+
+
+def get_word_info_cache():
+    global _word_info_cache, _word_info_cache_pid
+    if not _use_word_info_cache:
+        return None
+    with _word_info_memo_lock:
+        if _word_info_cache is None or _word_info_cache_pid != os.getpid():
+            _word_info_cache = WordInfoCache()
+            _word_info_cache_pid = os.getpid()
+    return _word_info_cache
+
+
+def get_word_infos(words, pos=None) -> dict[str, dict]:
+    """
+    get_word_info for many words at once. Every distinct word is resolved once: from the in-process memo,
+    then from the persistent cache, and only then from the dictionary. When dictionary tracing is on, every
+    word goes through the dictionary so the trace is complete.
+    """
+    pos = pos or ""
+    tracing = trace.enabled("dictionary")
+    unique_words = list(dict.fromkeys(words))
+    infos = {}
+    with _word_info_memo_lock:
+        for word in unique_words:
+            info = None if tracing else _word_info_memo.get((word, pos))
+            if info is not None:
+                _word_info_memo.move_to_end((word, pos))
+                infos[word] = info
+    missing = [word for word in unique_words if word not in infos]
+
+    cache = get_word_info_cache()
+    if missing and cache is not None and not tracing:
+        infos.update(cache.get_many(missing, pos))
+        missing = [word for word in missing if word not in infos]
+
+    if missing:
+        jam = get_lookup_instance()
+        resolved = {word: get_word_info(word, jam, pos) for word in missing}
+        infos.update(resolved)
+        if cache is not None:
+            cache.put_many(resolved, pos)
+
+    with _word_info_memo_lock:
+        for word in unique_words:
+            _word_info_memo[(word, pos)] = infos[word]
+            _word_info_memo.move_to_end((word, pos))
+        while len(_word_info_memo) > WORD_INFO_MEMO_SIZE:
+            _word_info_memo.popitem(last=False)
+    return infos
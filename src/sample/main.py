@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 
 # Standard library imports
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
+import functools
 import logging
 
 import colorlog
 import sys
+from tqdm import tqdm
 from tqdm.contrib.concurrent import thread_map
 from multiprocessing import cpu_count
 
@@ -20,22 +24,31 @@ from . import csv
 from . import args
 from . import pdf
 from . import epub
+from . import dictionary
+from . import trace
 
 
 def main():
     user_args = args.parse_arguments()
     check_invalid_options(user_args)
     configure_logging(user_args.debug)
+    trace.configure(user_args.trace if user_args.trace is not None else trace.subsystems if user_args.debug else [])
+    ocr.set_ocr_backend(user_args.ocr_backend, user_args.ocr_threads)
+    ocr.set_page_triage(user_args.skip_blank_pages)
+    dictionary.set_frequency_bank_path(Path(user_args.freq_dict))
+    dictionary.set_word_info_cache_enabled(not user_args.no_dict_cache)
+    if user_args.build_dict_index:
+        dictionary.build_dictionary_index()
 
     provided_path = Path(user_args.input_path)
     logging.info(f"Extracting texts from {provided_path}...")
 
     extractors = {
         "manga": lambda: texts_from_manga(
-            provided_path, user_args.parent, user_args.separate
+            provided_path, user_args.parent, user_args.separate, user_args.pipeline
         ),
         "pdf": lambda: texts_from_generic_file(
-            provided_path, "pdf", pdf.texts_from_pdf
+            provided_path, "pdf", functools.partial(pdf.texts_from_pdf, workers=user_args.workers)
         ),
         "epub": lambda: texts_from_generic_file(
             provided_path, "epub", epub.texts_from_epub
@@ -46,7 +59,7 @@ def main():
     }
 
     try:
-        results: dict[str, list[str]] = extractors[user_args.type.lower()]()
+        results: dict[str, list[str]] | Iterator[tuple[str, list[str]]] = extractors[user_args.type.lower()]()
     except KeyError:
         logging.error("Invalid type provided.")
         sys.exit(1)
@@ -57,15 +70,24 @@ def main():
     bunpro_wrapper = BunproWrapper(user_args.bunpro_words)
 
     # If user wishes not to separate, treat as one giant file
-    if not user_args.separate:
+    if not user_args.separate and not isinstance(results, dict):
+        results = (("all", texts) for _, texts in results)
+    elif not user_args.separate:
         combined_values = []
         for value in results.values():
             combined_values.extend(value)
         results = {"all": combined_values}
+    vocabs = tokenizer.vocab_from_volumes(
+        results,
+        user_args.freq_order,
+        trace.enabled("tokenizer"),
+        user_args.batch_size,
+        user_args.workers,
+        user_args.tokenizer,
+        not user_args.no_token_cache,
+    )
     csvs = []
-    for name, texts in results.items():
-        logging.info(f"Getting vocabulary items from {name}...")
-        vocab, freq = tokenizer.vocab_from_texts(texts, user_args.freq_order, user_args.debug)
+    for name, (vocab, freq) in vocabs.items():
         logging.info(f"Vocabulary from {name}: {', '.join([x for x, _, _ in vocab][:100])}, ...")
         output_file = get_output_file_path(provided_path, user_args.type, True, name)
         processed = []
@@ -113,19 +135,41 @@ def main():
 
 
 def process_csvs(csvs, user_args):
+    process_file = functools.partial(
+        csv.process_vocab_file,
+        add_english=user_args.add_english,
+        add_furigana=user_args.furigana,
+        id=user_args.id,
+    )
+    max_workers = user_args.csv_workers or cpu_count()
     try:
-        thread_map(
-            lambda csv_file: csv.process_vocab_file(
-                csv_file, user_args.add_english, user_args.furigana, user_args.id
-            ),
-            csvs,
-            max_workers=cpu_count(),
-        )
+        if user_args.executor == "process":
+            # Each worker resolves the words of its own files, sharing results through the word-info cache
+            with ProcessPoolExecutor(
+                    max_workers=min(max_workers, len(csvs)),
+                    initializer=_init_csv_worker,
+                    initargs=(Path(user_args.freq_dict), not user_args.no_dict_cache, trace.enabled_subsystems()),
+            ) as executor:
+                list(tqdm(executor.map(process_file, csvs), total=len(csvs)))
+        else:
+            # Resolve each distinct word of the run once, the per-file workers then find it in the memo
+            dictionary.get_word_infos(
+                word for csv_file in csvs for word in csv.read_vocab_words(csv_file)
+            )
+            thread_map(process_file, csvs, max_workers=max_workers)
     except KeyboardInterrupt:
         logging.info("Process interrupted by user.")
         sys.exit(0)
 
 
+def _init_csv_worker(freq_dict: Path, use_dict_cache: bool, trace_subsystems: list[str]) -> None:
+    """Process pool initializer: apply the dictionary options and open this worker's dictionary."""
+    dictionary.set_frequency_bank_path(freq_dict)
+    dictionary.set_word_info_cache_enabled(use_dict_cache)
+    trace.configure(trace_subsystems)
+    dictionary.get_lookup_instance()
+
+
 def check_invalid_options(user_args):
     if user_args.parent and user_args.type != "manga":
         logging.error("Parent flag can only be used with manga.")
@@ -141,14 +185,21 @@ def check_invalid_options(user_args):
         logging.error("Furigana and ID are incompatible.")
         sys.exit(1)
 
+    if user_args.pipeline and user_args.type != "manga":
+        logging.error("Pipeline can only be used with manga.")
+        sys.exit(1)
+
 
 def texts_from_manga(
-        provided_path: Path, is_parent: bool, separate_vols: bool
-) -> dict[str, list[str]]:
+        provided_path: Path, is_parent: bool, separate_vols: bool, pipeline: bool = False
+) -> dict[str, list[str]] | Iterator[tuple[str, list[str]]]:
     if not provided_path.is_dir():
         logging.error("Provided path is not a directory.")
         sys.exit(1)
-    if separate_vols and is_parent:
+    if pipeline:
+        # Volumes are read while mokuro is still running, the tokenizer consumes them as they finish
+        volumes = ocr.texts_from_manga_while_ocr(provided_path, is_parent)
+    elif separate_vols and is_parent:
         volumes = ocr.texts_from_manga_chapters(provided_path)
     else:
         volumes = ocr.texts_from_manga_folder(provided_path, is_parent)
@@ -2,12 +2,42 @@
 # -*- coding: utf-8 -*-
 
 # Standard library imports
+import collections
+import functools
+import queue
 import subprocess
+import threading
 import json
 import logging
+import time
 from pathlib import Path
+from typing import Iterator
 import regex as re
 import os
+from natsort import natsorted
+from concurrent.futures import ThreadPoolExecutor
+
+# Local application imports
+from . import ocr_manifest, page_triage
+
+# Optional, much faster JSON parser
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Seconds between checks for volumes mokuro has finished
+OCR_POLL_INTERVAL = 2
+
+_ocr_backend = "inprocess"
+_ocr_threads = None
+_page_triage = False
+
+# Lines with a longer run of kanji are dropped
+MAX_CONSECUTIVE_KANJI = 10
+kanji_run_pattern = re.compile(r"\p{Han}+")
+long_kanji_run_pattern = re.compile(rf"\p{{Han}}{{{MAX_CONSECUTIVE_KANJI + 1}}}")
+
 
 def texts_from_manga_folder(path: Path, is_parent: bool) -> dict[str, list[str]]:
     run_mokuro(path, is_parent)
@@ -19,94 +49,319 @@ def texts_from_manga_chapters(path: str) -> dict[str, list[str]]:
     return get_lines_from_volumes(path)
 
 
-def run_mokuro(path: Path, is_parent: bool) -> None:
+def texts_from_manga_while_ocr(path: Path, is_parent: bool) -> Iterator[tuple[str, list[str]]]:
+    """
+    Start mokuro in the background and return an iterator of (volume name, lines) that yields each volume
+    as soon as mokuro has finished it, in volume order, so it can be tokenized while OCR runs on the rest.
+    """
+    base_path = path if is_parent else path.parent
+    volume_paths, pending = plan_ocr(path, is_parent)
+    if in_process_ocr_available():
+        finished = queue.Queue()
+        threading.Thread(
+            target=_ocr_in_background, args=(base_path, volume_paths, pending, finished), name="mokuro", daemon=True
+        ).start()
+        return _queued_volume_texts(finished, base_path)
+
+    process = None
+    if pending:
+        command = mokuro_command(pending)
+        logging.info(f"Running mokuro in the background with command: {command}")
+        process = subprocess.Popen(command, text=True)
+    return _finished_volume_texts(process, base_path, volume_paths, pending, time.time())
+
+
+def _finished_volume_texts(
+        process: subprocess.Popen, base_path: Path, volume_paths: list[Path], pending: list[Path], started: float
+) -> Iterator[tuple[str, list[str]]]:
+    waiting = collections.deque(volume_paths)
+    try:
+        while waiting:
+            ocr_done = process is None or process.poll() is not None
+            # mokuro works through the volumes in order, a later one is never finished before an earlier one
+            while waiting and (
+                    ocr_done or waiting[0] not in pending or is_volume_finished(base_path, waiting[0], started)
+            ):
+                volume_path = waiting.popleft()
+                ocr_manifest.record_volume(base_path, volume_path)
+                yield from _volume_texts(base_path, ocr_manifest.volume_name(volume_path))
+            if waiting:
+                time.sleep(OCR_POLL_INTERVAL)
+    finally:
+        if process is not None:
+            if process.poll() is None:
+                process.terminate()
+            if process.wait() != 0:
+                logging.error("Mokuro failed to run.")
+
+
+def _ocr_in_background(base_path: Path, volume_paths: list[Path], pending: list[Path], finished: queue.Queue) -> None:
+    ocr_runs = ocr_volumes_in_process(pending)
     try:
-        command = ["mokuro", "--disable_confirmation=true"]
-        if is_parent:
-            command.append("--parent_dir=" + path.as_posix())
-        else:
-            command.append(path.as_posix())
-        logging.info(f"Running mokuro with command: {command}")
-        logging.info("This may take a while...")
-        subprocess.run(command, text=True, check=True)
+        for volume_path in volume_paths:
+            if volume_path in pending:
+                next(ocr_runs, None)
+            ocr_manifest.record_volume(base_path, volume_path)
+            finished.put(ocr_manifest.volume_name(volume_path))
+    finally:
+        ocr_runs.close()
+        finished.put(None)
+
+
+def _queued_volume_texts(finished: queue.Queue, base_path: Path) -> Iterator[tuple[str, list[str]]]:
+    while (name := finished.get()) is not None:
+        yield from _volume_texts(base_path, name)
+
+
+def _volume_texts(base_path: Path, name: str) -> Iterator[tuple[str, list[str]]]:
+    volumes = index_ocr_folder(base_path / "_ocr", name)
+    if name in volumes:
+        logging.info(f"OCR finished for {name}")
+        yield name, lines_from_page_groups(volumes)[name]
+
+
+def find_manga_volumes(path: Path) -> list[Path]:
+    """
+    The volumes mokuro processes in a parent folder: its folders and zip/cbz archives, one path per volume as
+    an archive extracted in place by an earlier run is the same volume as its folder. In the order mokuro
+    works through them, e.g. "Vol 2" before "Vol 10".
+    """
+    return natsorted(ocr_manifest.mokuro_volume_paths([
+        p for p in path.absolute().iterdir()
+        if (p.is_dir() and p.name != "_ocr") or p.suffix.lower() in ocr_manifest.manga_archive_suffixes
+    ]))
+
+
+def plan_ocr(path: Path, is_parent: bool) -> tuple[list[Path], list[Path]]:
+    """
+    Return all volumes and the ones that need OCR: volumes that are new, or whose pages changed since their
+    last OCR run. Unchanged volumes reuse their OCR results.
+    """
+    base_path = path if is_parent else path.parent
+    volume_paths = find_manga_volumes(path) if is_parent else [path.absolute()]
+    if not _page_triage:
+        restored = sum(page_triage.restore_skipped_pages(base_path, volume_path) for volume_path in volume_paths)
+        if restored:
+            logging.info(f"Page triage is off, {restored} page(s) it skipped before will be OCRed")
+    pending = [volume_path for volume_path in volume_paths if ocr_manifest.prepare_volume(base_path, volume_path)]
+    if len(pending) < len(volume_paths):
+        logging.info(f"Skipping OCR of {len(volume_paths) - len(pending)} volume(s) unchanged since the last run")
+    if _page_triage:
+        triage_volumes(base_path, pending)
+    return volume_paths, pending
+
+
+def set_page_triage(enabled: bool) -> None:
+    """Skip the OCR of blank pages and duplicate scans, see page_triage."""
+    global _page_triage
+    _page_triage = enabled
+
+
+def triage_volumes(base_path: Path, volume_paths: list[Path]) -> None:
+    skipped = collections.Counter()
+    for volume_path in volume_paths:
+        skipped.update(page_triage.triage_volume(base_path, volume_path))
+    if skipped:
         logging.info(
-            "Mokuro finished running. Do not worry if it looks stuck for a second."
+            f"Page triage saved {skipped.total()} OCR pass(es): "
+            f"{skipped['blank']} blank and {skipped['duplicate']} duplicate page(s)"
         )
-    except subprocess.CalledProcessError as e:
-        logging.error("Mokuro failed to run.")
+
+
+def is_volume_finished(base_path: Path, volume_path: Path, since: float) -> bool:
+    # mokuro (re)writes <volume>.mokuro (<volume>.html before 0.2) once all pages of the volume are done
+    name = ocr_manifest.volume_name(volume_path)
+    for suffix in (".mokuro", ".html"):
+        try:
+            if (base_path / f"{name}{suffix}").stat().st_mtime >= since:
+                return True
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def mokuro_command(volume_paths: list[Path]) -> list[str]:
+    return ["mokuro", "--disable_confirmation=true"] + [volume_path.as_posix() for volume_path in volume_paths]
+
+
+def set_ocr_backend(backend: str, threads: int = None) -> None:
+    """
+    backend: "inprocess" drives mokuro's Python API with the models loaded once per run, falling back to
+    the mokuro command if that is not available; "subprocess" always runs the mokuro command.
+    threads: CPU threads used by the in-process OCR models, all cores by default. torch applies this to the
+    whole process while OCR runs, so with --pipeline it also limits tokenization in this process until then.
+    """
+    global _ocr_backend, _ocr_threads
+    _ocr_backend = backend
+    _ocr_threads = threads
+
+
+def in_process_ocr_available() -> bool:
+    return _ocr_backend == "inprocess" and mokuro_importable()
+
+
+@functools.lru_cache
+def mokuro_importable() -> bool:
+    try:
+        from mokuro import MokuroGenerator
+        from mokuro.volume import VolumeCollection
+    except ImportError as e:
+        logging.warning(f"Cannot run mokuro in-process ({e}), running the mokuro command instead.")
+        return False
+    return True
+
+
+@functools.lru_cache
+def get_mokuro_generator():
+    """One generator per process, so the detection and OCR models are loaded once for all volumes."""
+    from mokuro import MokuroGenerator
+
+    return MokuroGenerator()
+
+
+def ocr_volumes_in_process(volume_paths: list[Path]) -> Iterator[str]:
+    """Run mokuro on the volumes in the given order, like the mokuro command does, yielding each name once it is done."""
+    from mokuro.volume import VolumeCollection
+    try:
+        from mokuro.legacy.overlay_generator import generate_legacy_html
+    except ImportError:
+        generate_legacy_html = None
+
+    volumes = VolumeCollection()
+    for volume_path in volume_paths:
+        volumes.add_path_in(volume_path)
+    for title in volumes.titles.values():
+        title.set_uuid()
+    order = {ocr_manifest.volume_name(volume_path): i for i, volume_path in enumerate(volume_paths)}
+
+    torch_threads = None
+    if _ocr_threads:
+        import torch
+        # torch's thread count is per process, it is restored once OCR is done
+        torch_threads = torch.get_num_threads()
+        torch.set_num_threads(_ocr_threads)
+    try:
+        generator = get_mokuro_generator()
+        for i, volume in enumerate(sorted(volumes, key=lambda volume: order[volume.name])):
+            logging.info(f"Running OCR on {i + 1}/{len(volumes)}: {volume.path_in}")
+            try:
+                # The mokuro command writes legacy HTML too, which needs zipped volumes extracted in place
+                volume.unzip(None)
+                generator.process_volume(volume)
+                if generate_legacy_html is not None:
+                    generate_legacy_html(volume)
+            except Exception:
+                logging.exception(f"Mokuro failed on {volume.path_in}")
+            yield volume.name
+    finally:
+        if torch_threads is not None:
+            torch.set_num_threads(torch_threads)
+
+
+def run_mokuro(path: Path, is_parent: bool) -> None:
+    base_path = path if is_parent else path.parent
+    volume_paths, pending = plan_ocr(path, is_parent)
+    if pending and in_process_ocr_available():
+        for _ in ocr_volumes_in_process(pending):
+            pass
+        logging.info("Mokuro finished running.")
+    elif pending:
+        try:
+            command = mokuro_command(pending)
+            logging.info(f"Running mokuro with command: {command}")
+            logging.info("This may take a while...")
+            subprocess.run(command, text=True, check=True)
+            logging.info(
+                "Mokuro finished running. Do not worry if it looks stuck for a second."
+            )
+        except subprocess.CalledProcessError as e:
+            logging.error("Mokuro failed to run.")
+    for volume_path in volume_paths:
+        ocr_manifest.record_volume(base_path, volume_path)
 
 
 def get_lines_from_volumes(path: Path) -> dict[str, list[str]]:
-    chapters = {}
-    # Get each individual folder containing json files
-    json_folders = find_folders_with_json_files(path)
-    for folder in json_folders:
-        chapters[folder.name] = get_lines_from_json_folder(folder)
-    return chapters
+    volumes = index_ocr_folder(path / "_ocr")
+    return lines_from_page_groups(volumes)
 
 
 def find_folders_with_json_files(path: Path) -> set[Path]:
-    json_files = path.rglob("*.json")
-    folders = {
-        json_file.parent
-        for json_file in json_files
-        if json_file.parent.parent == path / "_ocr"
-    }
-    return folders
+    return {path / "_ocr" / name for name in index_ocr_folder(path / "_ocr")}
 
 
 def get_lines_from_json_folder(path: Path) -> list[str]:
-    all_lines = []
-    json_files = path.rglob("*.json")
-    for json_file in json_files:
-        all_lines.extend(process_json_file(json_file))
-    return all_lines
+    return lines_from_page_groups({path.name: natsorted(path.rglob("*.json"))})[path.name]
 
 
 def get_lines_from_mokuro_output(path: Path, is_parent: bool) -> list[str]:
     base_path = path if is_parent else path.parent
     ocr_result_path = base_path / "_ocr"
     manga_name = os.path.basename(os.path.normpath(path))
-    json_files = ocr_result_path.rglob("*.json")
+    # if multiple manga items are in the same folder, only read this one's volume to prevent cross-manga vocab pollution
+    volumes = index_ocr_folder(ocr_result_path, None if is_parent else manga_name)
     all_lines = []
-    for json_file in json_files:
-        # if multiple manga items are in the same folder, we need to check to prevent cross-manga vocab pollution
-        if manga_name in json_file.parts:
-            logging.debug(f"Processing {json_file}")
-            all_lines.extend(process_json_file(json_file))
-        else:
-            logging.debug(f"Ignoring {json_file}")
+    for lines in lines_from_page_groups(volumes).values():
+        all_lines.extend(lines)
     return all_lines
 
 
+def index_ocr_folder(ocr_path: Path, volume: str = None) -> dict[str, list[Path]]:
+    """
+    Walk a mokuro _ocr folder once and return the page JSON files of each volume folder in it, by volume
+    name and in page order. With volume, only that volume's folder is walked.
+    """
+    volumes = {}
+    if not ocr_path.is_dir():
+        return volumes
+    names = [volume] if volume is not None else natsorted(entry.name for entry in os.scandir(ocr_path) if entry.is_dir())
+    for name in names:
+        pages = []
+        for root, dirs, files in os.walk(ocr_path / name):
+            # Page order as mokuro has it, e.g. 2.json before 10.json
+            dirs[:] = natsorted(dirs)
+            pages.extend(Path(root) / file for file in natsorted(files) if file.endswith(".json"))
+        if pages:
+            volumes[name] = pages
+    logging.debug(f"Found {sum(len(pages) for pages in volumes.values())} OCR pages in {len(volumes)} volume(s)")
+    return volumes
+
+
+def lines_from_page_groups(groups: dict[str, list[Path]]) -> dict[str, list[str]]:
+    """Read the pages of every group, keeping the groups and their pages in order."""
+    # Page files are small, reading many of them at once hides the file system latency. Parsing stays on
+    # this thread, where it does not compete with the readers for the GIL.
+    with ThreadPoolExecutor() as executor:
+        return {
+            name: [line for data in executor.map(Path.read_bytes, pages) for line in lines_from_page_bytes(data)]
+            for name, pages in groups.items()
+        }
+
+
 def process_json_file(json_file: Path) -> list[str]:
-    with open(json_file, "r", encoding="utf-8") as file:
-        data = json.load(file)
-        return extract_lines_from_data(data)
+    return lines_from_page_bytes(json_file.read_bytes())
 
 
-def extract_lines_from_data(data: dict) -> list[str]:
-    all_lines = []
-    for block in data.get("blocks", []):
-        lines = block.get("lines", [])
-        for line in lines:
-            if max_consecutive_kanji(line) <= 10:
-                all_lines.append(line)
-    return all_lines
+def lines_from_page_bytes(data: bytes) -> list[str]:
+    return extract_lines_from_data(parse_json(data))
 
 
-def max_consecutive_kanji(s: str) -> int:
-    # Regular expression to match Kanji characters
-    kanji_regex = re.compile(r"\p{Han}")
+def parse_json(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def extract_lines_from_data(data: dict) -> list[str]:
+    return filter_page_lines([line for block in data.get("blocks", []) for line in block.get("lines", [])])
 
-    max_count = 0
-    current_count = 0
 
-    for char in s:
-        if kanji_regex.match(char):
-            current_count += 1
-            max_count = max(max_count, current_count)
-        else:
-            current_count = 0
+def filter_page_lines(lines: list[str]) -> list[str]:
+    """
+    Drop the lines with a run of more than MAX_CONSECUTIVE_KANJI kanji, usually OCR noise. Most pages have
+    none, so the whole page is checked with one search and only pages with a match are filtered per line.
+    """
+    if not long_kanji_run_pattern.search("\n".join(lines)):
+        return lines
+    return [line for line in lines if max_consecutive_kanji(line) <= MAX_CONSECUTIVE_KANJI]
 
-    return max_count
+
+def max_consecutive_kanji(s: str) -> int:
+    return max(map(len, kanji_run_pattern.findall(s)), default=0)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+# Image types the pinned mokuro (0.2.1) reads from a volume folder
+page_image_suffixes = [".jpg", ".jpeg", ".png", ".webp"]
+manga_archive_suffixes = [".zip", ".cbz"]
+# mokuro reads a volume from its folder if there is one (e.g. extracted by an earlier run), else its cbz, else its zip
+volume_format_preference = ["", ".cbz", ".zip"]
+
+
+def volume_name(volume_path: Path) -> str:
+    """Name mokuro gives a volume folder or zip/cbz archive, also used for its _ocr folder."""
+    return volume_path.stem if volume_path.suffix.lower() in manga_archive_suffixes else volume_path.name
+
+
+def mokuro_volume_paths(paths: list[Path]) -> list[Path]:
+    """Keep one path per volume name, the one mokuro reads the volume from."""
+    volumes = {}
+    for path in paths:
+        volumes.setdefault((path.parent, volume_name(path)), []).append(path)
+    return [
+        min(group, key=lambda path: volume_format_preference.index("" if path.is_dir() else path.suffix.lower()))
+        for group in volumes.values()
+    ]
+
+
+def manifest_path(base_path: Path, name: str) -> Path:
+    return base_path / "_ocr" / f"{name}.jve-manifest"
+
+
+def list_pages(volume_path: Path) -> dict[str, list[int]]:
+    """Page image path relative to the volume -> [size, mtime]. An archive counts as a single page ""."""
+    if volume_path.is_file():
+        stat = volume_path.stat()
+        return {"": [stat.st_size, stat.st_mtime_ns]}
+    pages = {}
+    for root, _, files in os.walk(volume_path):
+        for file in files:
+            if Path(file).suffix.lower() in page_image_suffixes:
+                page = Path(root) / file
+                stat = page.stat()
+                pages[page.relative_to(volume_path).as_posix()] = [stat.st_size, stat.st_mtime_ns]
+    return pages
+
+
+def page_digest(volume_path: Path, page: str) -> str:
+    with open(volume_path / page if page else volume_path, "rb") as f:
+        return hashlib.file_digest(f, "sha1").hexdigest()
+
+
+def load_manifest(base_path: Path, name: str):
+    try:
+        manifest = json.loads(manifest_path(base_path, name).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest["pages"]
+
+
+def page_result_path(base_path: Path, name: str, page: str) -> Path:
+    # mokuro stores the OCR result of <volume>/<page>.jpg as _ocr/<volume>/<page>.json
+    return (base_path / "_ocr" / name / page).with_suffix(".json")
+
+
+def has_ocr_results(base_path: Path, name: str, pages) -> bool:
+    if not (base_path / f"{name}.mokuro").is_file():
+        return False
+    return all(page_result_path(base_path, name, page).is_file() for page in pages if page)
+
+
+def prepare_volume(base_path: Path, volume_path: Path) -> bool:
+    """
+    Compare a volume's page images with the manifest of its last OCR run and delete the OCR results of pages
+    that changed or were removed since. Returns whether the volume needs OCR at all.
+    """
+    name = volume_name(volume_path)
+    pages = list_pages(volume_path)
+    recorded = load_manifest(base_path, name)
+    # An archive is recorded as its single page "". Once mokuro extracted it in place, the volume is read from
+    # that folder, whose pages the manifest of the archive cannot be compared with
+    if recorded is None or ("" in recorded) != ("" in pages):
+        # Results of a run without (a comparable) manifest are trusted, like mokuro itself does
+        return not has_ocr_results(base_path, name, pages)
+
+    stale = [page for page in recorded if page not in pages]
+    for page, stat in pages.items():
+        entry = recorded.get(page)
+        # Only hash pages whose size or modification time changed
+        if entry is not None and entry[:2] != stat and page_digest(volume_path, page) != entry[2]:
+            stale.append(page)
+    if stale:
+        logging.info(f"{len(stale)} page(s) of {name} changed since the last OCR run")
+        remove_page_results(base_path, name, stale)
+    return bool(stale) or not has_ocr_results(base_path, name, pages)
+
+
+def remove_page_results(base_path: Path, name: str, pages: list[str]) -> None:
+    if "" in pages:
+        # The archive changed, none of its results can be matched to its pages anymore
+        shutil.rmtree(base_path / "_ocr" / name, ignore_errors=True)
+    for page in pages:
+        if page:
+            page_result_path(base_path, name, page).unlink(missing_ok=True)
+    # mokuro restores missing page results from the .mokuro file, drop them there too
+    mokuro_path = base_path / f"{name}.mokuro"
+    try:
+        mokuro_data = json.loads(mokuro_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    mokuro_data["pages"] = [
+        page for page in mokuro_data.get("pages", [])
+        if "" not in pages and page.get("img_path") not in pages
+    ]
+    mokuro_path.write_text(json.dumps(mokuro_data, ensure_ascii=False), encoding="utf-8")
+
+
+def record_volume(base_path: Path, volume_path: Path) -> None:
+    """Save the manifest of the pages that have OCR results now, after OCR ran or was skipped."""
+    name = volume_name(volume_path)
+    recorded = load_manifest(base_path, name) or {}
+    manifest = {}
+    for page, stat in list_pages(volume_path).items():
+        if not has_ocr_results(base_path, name, [page]):
+            continue
+        entry = recorded.get(page)
+        digest = entry[2] if entry is not None and entry[:2] == stat else page_digest(volume_path, page)
+        manifest[page] = stat + [digest]
+    path = manifest_path(base_path, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_text(json.dumps({"version": MANIFEST_VERSION, "pages": manifest}), encoding="utf-8")
+    os.replace(temp_path, path)
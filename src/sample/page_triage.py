@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Local application imports
+from . import ocr_manifest
+
+# Pages with less ink than this share of their area are blank (white pages, black spreads). A single 30px
+# character on an 1100x1600 page is about 0.0001, so a lone short line of text is never skipped
+MIN_INK_DENSITY = 0.00005
+# Difference from the page's background brightness for a pixel to count as ink
+INK_CONTRAST = 64
+# Ink is measured at this fraction of the page resolution, coarser samples blur thin strokes away
+INK_SAMPLE_SCALE = 2
+# dHash grid size (64 bits), and how many bits two pages may differ in to count as the same scan
+HASH_SIZE = 8
+MAX_DUPLICATE_DISTANCE = 4
+
+
+def page_fingerprint(image_path: Path) -> tuple[float, int, int, int] | None:
+    """Ink density, dHash and size of a page image, or None if it cannot be read. Such pages are OCRed as usual."""
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+            sample_width = max(1, width // INK_SAMPLE_SCALE)
+            # Lets JPEG pages decode at the sample resolution directly
+            image.draft("L", (sample_width, max(1, height // INK_SAMPLE_SCALE)))
+            gray = image.convert("L")
+            if gray.width >= 2 * sample_width:
+                gray = gray.reduce(gray.width // sample_width)
+            sample = np.asarray(gray, dtype=np.int16)
+            hash_sample = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE)), dtype=np.int16)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logging.warning(f"Could not check page {image_path} for triage ({e}), it will be OCRed.")
+        return None
+    ink_density = float(np.mean(np.abs(sample - np.median(sample)) > INK_CONTRAST))
+    bits = (hash_sample[:, 1:] > hash_sample[:, :-1]).flatten()
+    dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return ink_density, dhash, width, height
+
+
+def triage_pages(image_paths: list[Path]) -> dict[Path, tuple[str, int, int]]:
+    """
+    Return the pages not worth an OCR pass with their size and the reason: "blank", or "duplicate" of an
+    earlier page.
+    """
+    # Pillow releases the GIL while decoding
+    with ThreadPoolExecutor() as executor:
+        fingerprints = list(executor.map(page_fingerprint, image_paths))
+    skipped = {}
+    kept_hashes = []
+    for image_path, fingerprint in zip(image_paths, fingerprints):
+        if fingerprint is None:
+            continue
+        ink_density, dhash, width, height = fingerprint
+        if ink_density < MIN_INK_DENSITY:
+            skipped[image_path] = ("blank", width, height)
+        elif any((dhash ^ kept).bit_count() <= MAX_DUPLICATE_DISTANCE for kept in kept_hashes):
+            skipped[image_path] = ("duplicate", width, height)
+        else:
+            kept_hashes.append(dhash)
+    return skipped
+
+
+def triage_volume(base_path: Path, volume_path: Path) -> dict[str, int]:
+    """
+    Write an empty OCR result for every blank or duplicate page of a volume folder that has no result yet,
+    so mokuro skips it. Returns the number of skipped pages by reason.
+    """
+    if volume_path.is_file():
+        # Pages of zip/cbz archives are only extracted by mokuro
+        return {}
+    name = ocr_manifest.volume_name(volume_path)
+    pending = [
+        page for page in sorted(ocr_manifest.list_pages(volume_path))
+        if not ocr_manifest.page_result_path(base_path, name, page).is_file()
+    ]
+    if not pending:
+        return {}
+    try:
+        skipped = triage_pages([volume_path / page for page in pending])
+    except ImportError as e:
+        logging.warning(f"Page triage needs numpy and Pillow ({e}), all pages will be OCRed.")
+        return {}
+    if not skipped:
+        return {}
+    pages = {image_path.relative_to(volume_path).as_posix(): skip for image_path, skip in skipped.items()}
+    # Listed before the results are written, so they can be found again even if this run is interrupted
+    save_skipped_pages(
+        base_path, name, load_skipped_pages(base_path, name) | {page: reason for page, (reason, _, _) in pages.items()}
+    )
+    counts = {}
+    for page, (reason, width, height) in pages.items():
+        json_path = ocr_manifest.page_result_path(base_path, name, page)
+        json_path.parent.mkdir(parents=True, exist_ok=True)
+        # Same layout as a mokuro page result, without text blocks
+        json_path.write_text(
+            json.dumps({"img_width": width, "img_height": height, "blocks": [], "jve_skipped": reason}),
+            encoding="utf-8",
+        )
+        counts[reason] = counts.get(reason, 0) + 1
+    return counts
+
+
+def restore_skipped_pages(base_path: Path, volume_path: Path) -> int:
+    """
+    Remove the empty results triage wrote for a volume, so that its pages are OCRed like any other when
+    triage is off. Returns the number of restored pages.
+    """
+    name = ocr_manifest.volume_name(volume_path)
+    path = skipped_pages_path(base_path, name)
+    if not path.is_file():
+        return 0
+    restored = []
+    for page in load_skipped_pages(base_path, name):
+        try:
+            result = json.loads(ocr_manifest.page_result_path(base_path, name, page).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        # The page may have been OCRed for real since, after it changed
+        if "jve_skipped" in result:
+            restored.append(page)
+    if restored:
+        ocr_manifest.remove_page_results(base_path, name, restored)
+    path.unlink()
+    return len(restored)
+
+
+def skipped_pages_path(base_path: Path, name: str) -> Path:
+    return base_path / "_ocr" / f"{name}.jve-skipped"
+
+
+def load_skipped_pages(base_path: Path, name: str) -> dict[str, str]:
+    """Page -> reason of every page triage wrote an empty result for."""
+    try:
+        return json.loads(skipped_pages_path(base_path, name).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_skipped_pages(base_path: Path, name: str, pages: dict[str, str]) -> None:
+    path = skipped_pages_path(base_path, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(pages), encoding="utf-8")
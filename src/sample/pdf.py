@@ -2,15 +2,50 @@
 # -*- coding: utf-8 -*-
 
 # Standard library imports
+import functools
+import math
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
 # Third-party imports (install these with pip)
 import pypdf
 
+# Smaller PDFs are not worth starting worker processes for
+MIN_PAGES_FOR_POOL = 32
 
-def texts_from_pdf(pdf_path: Path) -> list:
+
+def texts_from_pdf(pdf_path: Path, workers: int = 1) -> Iterator[str]:
+    """
+    Yield the text of every page in order. With workers > 1, page ranges are extracted in a pool of that
+    many worker processes, and each page is yielded as soon as it and all pages before it are done.
+    """
     pdf = pypdf.PdfReader(pdf_path.as_posix())
-    pages = []
-    for page in pdf.pages:
-        pages.append(page.extract_text())
-    return pages
+    page_count = len(pdf.pages)
+    if workers <= 1 or page_count < MIN_PAGES_FOR_POOL:
+        for page in pdf.pages:
+            yield page.extract_text()
+        return
+    del pdf
+    # A few ranges per worker keeps the pool busy when pages differ in size
+    range_size = math.ceil(page_count / (workers * 4))
+    starts = range(0, page_count, range_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for texts in executor.map(
+                _extract_page_range,
+                [pdf_path.as_posix()] * len(starts),
+                starts,
+                [min(start + range_size, page_count) for start in starts],
+        ):
+            yield from texts
+
+
+@functools.lru_cache(maxsize=1)
+def _open_pdf(pdf_path: str) -> pypdf.PdfReader:
+    # Each worker parses the PDF once and reuses it for all of its ranges
+    return pypdf.PdfReader(pdf_path)
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> list[str]:
+    pages = _open_pdf(pdf_path).pages
+    return [pages[i].extract_text() for i in range(start, stop)]
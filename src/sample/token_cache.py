@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+
+class TokenCache:
+    """
+    On-disk cache of the filtered tokens of every text chunk, keyed by a hash of the chunk text and the
+    tokenizer model/version. Least recently used chunks are evicted once the cache grows past max_entries.
+    """
+
+    def __init__(self, path: Path = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if path is None:
+            cache_root = Path.home() / ".cache" / "jve-token-cache"
+            cache_root.mkdir(parents=True, exist_ok=True)
+            path = cache_root / "tokens.sqlite3"
+        self.path = path
+        self.max_entries = max_entries
+        logging.debug("Token cache path: {}".format(self.path))
+        # Worker processes share the file, so wait for each other's writes instead of failing
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[tuple[str, str, str]]]:
+        found = {}
+        for key in set(keys):
+            row = self.connection.execute("SELECT tokens FROM tokens WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                found[key] = [tuple(token) for token in json.loads(row[0])]
+        if found:
+            now = time.time_ns()
+            self.connection.executemany(
+                "UPDATE tokens SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            self.connection.commit()
+        return found
+
+    def put_many(self, items: dict[str, list[tuple[str, str, str]]]) -> None:
+        now = time.time_ns()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO tokens (key, tokens, last_used) VALUES (?, ?, ?)",
+            [(key, json.dumps(tokens, ensure_ascii=False), now) for key, tokens in items.items()],
+        )
+        self.connection.commit()
+
+    def evict(self) -> None:
+        """Drop the least recently used entries beyond max_entries."""
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM tokens").fetchone()
+        if count <= self.max_entries:
+            return
+        self.connection.execute(
+            "DELETE FROM tokens WHERE key IN (SELECT key FROM tokens ORDER BY last_used LIMIT ?)",
+            (count - self.max_entries,),
+        )
+        self.connection.commit()
+        logging.debug(f"Evicted {count - self.max_entries} entries from the token cache")
+
+
+_token_cache = None
+_token_cache_pid = None
+
+
+def get_token_cache() -> TokenCache:
+    """Return this process' token cache. SQLite connections must not cross a fork, so each process opens its own."""
+    global _token_cache, _token_cache_pid
+    if _token_cache is None or _token_cache_pid != os.getpid():
+        _token_cache = TokenCache()
+        _token_cache_pid = os.getpid()
+    return _token_cache
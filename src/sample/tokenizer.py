@@ -1,10 +1,25 @@
+import collections
+import functools
+import importlib.metadata
+import itertools
 import json
 import logging
-from typing import Any
+import math
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from typing import Any, Iterable, Iterator
 
 import regex as re
 
 import spacy
+from spacy.attrs import LEMMA, NORM, POS
+from spacy.parts_of_speech import IDS as POS_IDS
+
+from . import chunker
+from . import token_cache
+from . import trace
 
 excluded_pos2 = [
     # aux verbs - "ない"
@@ -46,75 +61,436 @@ excluded_pos = [
     # personal names
     "PROPN",
     "INTJ",
+    "SPACE",
 ]
 
 
-def vocab_from_texts(texts: list, freq_order: bool, debug: bool) -> tuple[list[Any] | list, dict[Any, int]]:
-    vocab = []
-    confirm_japanese_pattern = re.compile(r"[\p{IsHiragana}\p{IsKatakana}\p{IsHan}]+")
-    hiragana_only_pattern = re.compile(r"[\p{IsHiragana}]+")
-    nlp = spacy.load('ja_ginza_electra')
-    debug_file = open("debug_word_info2.log", "w", encoding="utf-8")
+DEFAULT_BATCH_SIZE = 256
+# Workers are not forked from this process: with --pipeline, mokuro's torch threads may be running in it, and a
+# forked child can deadlock on a lock one of them held
+worker_start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# Bump whenever is_vocab_token or the backends change which tokens they keep, to invalidate cached tokens
+FILTER_VERSION = 2
+
+
+def vocab_from_texts(
+        texts: Iterable[str],
+        freq_order: bool,
+        debug: bool,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        backend: str = "electra",
+        use_cache: bool = True,
+) -> tuple[list[Any] | list, dict[Any, int]]:
+    chunks = chunker.chunk_counted_lines(count_japanese_lines(texts).items())
+    return vocab_from_chunks(chunks, freq_order, debug, batch_size, n_process, backend, use_cache)
+
+
+def count_japanese_lines(texts: Iterable[str]) -> dict[str, int]:
+    """
+    Split texts into lines, drop lines without any kana or kanji and collapse repeated lines (subtitle
+    OP/ED lyrics, catchphrases) into one entry with its number of occurrences, in order of first appearance.
+    """
+    counts = {}
     for text in texts:
-        doc = nlp(text)
-        for token in doc:
-            lemma = token.norm_ if token.pos_ == "VERB" else token.lemma_
-            hiragana_only = hiragana_only_pattern.match(lemma)
-            if len(lemma) < 2 and hiragana_only:
-                # logging.info(f"Skipped {lemma}")
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or not confirm_japanese_pattern.search(line):
                 continue
-            pos = token.pos_
-            if pos not in included_pos and pos not in excluded_pos:
-                print('UNKNOWN POS', pos)
-            pos_ok = pos in included_pos
-            if pos == "PRON":
-                pos_ok = pos_ok and not hiragana_only_pattern.match(lemma)
-            if pos == "CCONJ":
-                pos_ok = pos_ok and len(lemma) > 2
-            if confirm_japanese_pattern.match(lemma) and pos_ok:
-                vocab.append((lemma, token.norm_, token.pos_))
-            debug_file.write(" ".join([
-                f"i={token.i}",
-                f"orth={token.orth_}",
-                f"lemma_={token.lemma_}",
-                f"norm_={token.norm_}",
-                f"reading={token.morph.get("Reading")}",
-                f"pos={token.pos_}",
-                f"Inflection={token.morph.get("Inflection")}",
-                f"tag_={token.tag_}",
-                f"dep_={token.dep_}",
-                f"head.i={token.head.i}",
-                "\n"
-            ]))
-
-    freq = get_word_frequencies(vocab)
-
-    # Remove duplicates from list (not using a set to preserve order)
-    vocab = remove_duplicates(vocab)
-
-    if freq_order:
-        vocab = sorted(vocab, key=lambda word: freq[word], reverse=True)
-
-    return vocab, freq,
-
-
-def get_word_frequencies(vocab: list):
-    freq = dict()
-    for word, _, _ in vocab:
-        if word not in freq:
-            freq[word] = 0
-        freq[word] += 1
-    return freq
-
-
-def remove_duplicates(vocab: list) -> list:
-    known_words = set()
-    i = 0
-    while i < len(vocab):
-        if vocab[i][0] in known_words:
-            vocab.pop(i)
-            i -= 1
+            counts[line] = counts.get(line, 0) + 1
+    return counts
+
+
+def vocab_from_chunks(
+        chunks: Iterable[tuple[str, int]],
+        freq_order: bool,
+        debug: bool,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        backend: str = "electra",
+        use_cache: bool = True,
+) -> tuple[list[Any] | list, dict[Any, int]]:
+    """Tokenize (chunk, multiplicity) pairs, counting the words of every chunk multiplicity times."""
+    counts = collections.deque()
+
+    def chunk_texts():
+        for chunk, count in chunks:
+            counts.append(count)
+            yield chunk
+
+    aggregator = VocabAggregator()
+    for tokens in tokens_per_text(chunk_texts(), debug, batch_size, n_process, backend, use_cache):
+        count = counts.popleft()
+        for token in tokens:
+            aggregator.add(token, count)
+    return aggregator.result(freq_order)
+
+
+def vocab_from_volumes(
+        volumes: dict[str, list[str]] | Iterable[tuple[str, list[str]]],
+        freq_order: bool,
+        debug: bool,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        workers: int = 1,
+        backend: str = "electra",
+        use_cache: bool = True,
+) -> dict[str, tuple[list[Any], dict[Any, int]]]:
+    """
+    Tokenize every volume, sharding its text chunks across a pool of worker processes when workers > 1.
+    Shard results are merged back in shard order, so the output matches the serial path exactly.
+    Volumes can also be (name, texts) pairs that are still being produced, e.g. while OCR runs. Each one is
+    tokenized as soon as it arrives, and pairs with the same name are merged into one volume in order.
+    """
+    streamed = not isinstance(volumes, dict)
+    if not streamed:
+        volumes = volumes.items()
+    aggregators = {}
+    if workers <= 1:
+        for name, texts in volumes:
+            logging.info(f"Getting vocabulary items from {name}...")
+            vocab, freq = vocab_from_texts(
+                texts, False, debug, batch_size, backend=backend, use_cache=use_cache
+            )
+            aggregators.setdefault(name, VocabAggregator()).merge(vocab, freq)
+        return {name: aggregator.result(freq_order) for name, aggregator in aggregators.items()}
+
+    volumes = (
+        (name, list(chunker.chunk_counted_lines(count_japanese_lines(texts).items())))
+        for name, texts in volumes
+    )
+    if streamed:
+        # Volumes arrive one at a time, so spread each one over all workers
+        shard_size_of = lambda chunks: max(1, math.ceil(len(chunks) / workers))
+    else:
+        volumes = list(volumes)
+        total_chunks = sum(len(chunks) for _, chunks in volumes)
+        # A few shards per worker keeps the pool busy when volumes differ in size
+        shard_size = max(1, math.ceil(total_chunks / (workers * 4)))
+        shard_size_of = lambda chunks: shard_size
+    threads = max(1, cpu_count() // workers)
+    logging.info(f"Tokenizing volumes with {workers} worker processes ({threads} thread(s) each)...")
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(worker_start_method),
+            initializer=_init_worker,
+            initargs=(threads, trace.enabled_subsystems()),
+    ) as executor:
+        shard_futures = []
+        for name, chunks in volumes:
+            shard_size = shard_size_of(chunks)
+            shard_futures.extend(
+                (name, executor.submit(
+                    _vocab_from_shard, chunks[i:i + shard_size], debug, batch_size, backend, use_cache
+                ))
+                for i in range(0, len(chunks), shard_size)
+            )
+            aggregators.setdefault(name, VocabAggregator())
+        for i, (name, future) in enumerate(shard_futures):
+            aggregators[name].merge(*future.result())
+            if i + 1 == len(shard_futures) or shard_futures[i + 1][0] != name:
+                logging.info(f"Finished tokenizing {name}")
+    return {name: aggregator.result(freq_order) for name, aggregator in aggregators.items()}
+
+
+class VocabAggregator:
+    """
+    Vocabulary in order of first appearance plus word counts, built incrementally from a token stream.
+    Memory grows with the number of distinct words rather than the number of tokens.
+    """
+
+    def __init__(self):
+        # lemma -> (lemma, norm, pos) of its first appearance; dicts keep insertion order
+        self.entries = {}
+        self.freq = {}
+
+    def add(self, token: tuple[str, str, str], count: int = 1) -> None:
+        lemma = token[0]
+        if lemma in self.freq:
+            self.freq[lemma] += count
         else:
-            known_words.add(vocab[i][0])
-        i += 1
-    return vocab
+            self.entries[lemma] = token
+            self.freq[lemma] = count
+
+    def merge(self, vocab: list[Any], freq: dict[Any, int]) -> None:
+        """Fold in the result of a later shard, keeping the first appearance of each word."""
+        for token in vocab:
+            self.add(token, freq[token[0]])
+
+    def result(self, freq_order: bool) -> tuple[list[Any], dict[Any, int]]:
+        vocab = list(self.entries.values())
+        if freq_order:
+            vocab = sort_by_frequency(vocab, self.freq)
+        return vocab, self.freq
+
+
+def sort_by_frequency(vocab: list, freq: dict) -> list:
+    return sorted(vocab, key=lambda entry: freq[entry[0]], reverse=True)
+
+
+def _init_worker(threads: int, trace_subsystems: list[str]) -> None:
+    """Process pool initializer: cap torch threads so workers do not oversubscribe the CPU."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    trace.configure(trace_subsystems)
+
+
+def _vocab_from_shard(
+        chunks: list[tuple[str, int]], debug: bool, batch_size: int, backend: str, use_cache: bool
+) -> tuple[list[Any], dict[Any, int]]:
+    return vocab_from_chunks(chunks, False, debug, batch_size, backend=backend, use_cache=use_cache)
+
+
+confirm_japanese_pattern = re.compile(r"[\p{IsHiragana}\p{IsKatakana}\p{IsHan}]+")
+hiragana_only_pattern = re.compile(r"[\p{IsHiragana}]+")
+
+
+def is_vocab_token(lemma: str, pos: str) -> bool:
+    """Decide whether a token with the given lemma and universal POS tag belongs in the vocabulary."""
+    hiragana_only = hiragana_only_pattern.match(lemma)
+    if len(lemma) < 2 and hiragana_only:
+        return False
+    if pos not in included_pos and pos not in excluded_pos:
+        print('UNKNOWN POS', pos)
+    pos_ok = pos in included_pos
+    if pos == "PRON":
+        pos_ok = pos_ok and not hiragana_only
+    if pos == "CCONJ":
+        pos_ok = pos_ok and len(lemma) > 2
+    return bool(confirm_japanese_pattern.match(lemma) and pos_ok)
+
+
+# Components whose output vocabulary extraction never reads (dep_/head only show up in the tokenizer trace)
+lean_excluded_components = [
+    "parser",
+    "ner",
+    "bunsetu_recognizer",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(name: str = 'ja_ginza_electra', lean: bool = True):
+    """Load a spaCy model once per process, without the unused components unless lean is False."""
+    return spacy.load(name, exclude=lean_excluded_components if lean else [])
+
+
+class SpacyBackend:
+    """GiNZA models run through spaCy. Most accurate, and the slowest with the electra model."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.cache_namespace = f"{model_name}-{spacy.util.get_package_version(model_name)}"
+        self.included_pos_ids = {POS_IDS[pos] for pos in included_pos}
+        self.excluded_pos_ids = {POS_IDS[pos] for pos in excluded_pos}
+        # (lemma hash, POS id) -> keep/drop, so repeated words skip the regex checks
+        self.decisions = {}
+
+    def analyze(
+            self, texts: Iterable[str], debug: bool, batch_size: int, n_process: int
+    ) -> Iterator[list[tuple[str, str, str]]]:
+        # The full pipeline is only needed to fill in the dependency fields of the trace
+        nlp = load_model(self.model_name, lean=not debug)
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        if debug:
+            yield from self._tokens_with_trace(docs)
+            return
+        strings = nlp.vocab.strings
+        verb_id = POS_IDS["VERB"]
+        for doc in docs:
+            tokens = []
+            for pos_id, lemma_id, norm_id in doc.to_array([POS, LEMMA, NORM]).tolist():
+                if pos_id in self.excluded_pos_ids:
+                    continue
+                if pos_id == verb_id:
+                    lemma_id = norm_id
+                key = (lemma_id, pos_id)
+                keep = self.decisions.get(key)
+                if keep is None:
+                    keep = self.decisions[key] = is_vocab_token(strings[lemma_id], strings[pos_id])
+                if keep:
+                    tokens.append((strings[lemma_id], strings[norm_id], strings[pos_id]))
+            yield tokens
+
+    def _tokens_with_trace(self, docs) -> Iterator[list[tuple[str, str, str]]]:
+        for doc in docs:
+            tokens = []
+            for token in doc:
+                lemma = token.norm_ if token.pos_ == "VERB" else token.lemma_
+                if is_vocab_token(lemma, token.pos_):
+                    tokens.append((lemma, token.norm_, token.pos_))
+                trace.emit("tokenizer", " ".join([
+                    f"i={token.i}",
+                    f"orth={token.orth_}",
+                    f"lemma_={token.lemma_}",
+                    f"norm_={token.norm_}",
+                    f"reading={token.morph.get("Reading")}",
+                    f"pos={token.pos_}",
+                    f"Inflection={token.morph.get("Inflection")}",
+                    f"tag_={token.tag_}",
+                    f"dep_={token.dep_}",
+                    f"head.i={token.head.i}",
+                ]))
+            yield tokens
+
+
+# UniDic top-level part of speech -> universal POS tag, following the UD Japanese conversion GiNZA is trained on
+unidic_pos_map = {
+    "名詞": "NOUN",
+    "代名詞": "PRON",
+    "動詞": "VERB",
+    "形容詞": "ADJ",
+    "形状詞": "ADJ",
+    "連体詞": "ADJ",
+    "副詞": "ADV",
+    "接続詞": "CCONJ",
+    "感動詞": "INTJ",
+    "助動詞": "AUX",
+    "助詞": "ADP",
+    "接頭辞": "NOUN",
+    "接尾辞": "NOUN",
+    "補助記号": "PUNCT",
+    "記号": "SYM",
+    "空白": "SPACE",
+}
+
+demonstrative_pattern = re.compile(r"^[こそあど]")
+
+
+def unidic_to_upos(pos1: str, pos2: str, lemma: str, previous: tuple[str, str, str] = ("", "", "")) -> str:
+    """previous: pos1, pos2 and pos3 of the token before, which tells helper verbs apart."""
+    # する after a サ変 noun (勉強する), いる / しまう / ある / みる / ほしい after て / で, as GiNZA tags them
+    if pos1 in ("動詞", "形容詞") and pos2 == "非自立可能" and (
+            previous[:2] == ("助詞", "接続助詞") or (previous[0] == "名詞" and previous[2] == "サ変可能")
+    ):
+        return "AUX"
+    if pos1 == "名詞" and pos2 == "固有名詞":
+        return "PROPN"
+    if pos1 == "名詞" and pos2 == "数詞":
+        return "NUM"
+    if pos1 == "助詞" and pos2 == "接続助詞":
+        return "SCONJ"
+    if pos1 == "助詞" and pos2 == "終助詞":
+        return "PART"
+    if pos1 == "接尾辞" and pos2 in ("形容詞的", "形状詞的"):
+        return "ADJ"
+    if pos1 == "接尾辞" and pos2 == "動詞的":
+        return "VERB"
+    # この / その / あの / どの are determiners, 大きな / 小さな are adjectives
+    if pos1 == "連体詞" and demonstrative_pattern.match(lemma):
+        return "DET"
+    return unidic_pos_map.get(pos1, "X")
+
+
+class FugashiBackend:
+    """Plain MeCab/UniDic morphological analysis through fugashi. No neural model, so it is many times faster."""
+
+    def __init__(self):
+        self._tagger = None
+        # (lemma, POS) -> keep/drop, so repeated words skip the regex checks
+        self.decisions = {}
+
+    @property
+    def tagger(self):
+        if self._tagger is None:
+            try:
+                import fugashi
+                self._tagger = fugashi.Tagger()
+            except (ImportError, RuntimeError) as e:
+                # fugashi raises RuntimeError when it finds no UniDic dictionary
+                logging.error(f"The fugashi tokenizer requires the fugashi package and a UniDic dictionary "
+                              f"(pip install fugashi unidic-lite): {e}")
+                sys.exit(1)
+        return self._tagger
+
+    @property
+    def cache_namespace(self) -> str:
+        dictionary = self.tagger.dictionary_info[0]
+        return f"fugashi-{importlib.metadata.version('fugashi')}-{dictionary['filename']}-{dictionary['version']}"
+
+    def analyze(
+            self, texts: Iterable[str], debug: bool, batch_size: int, n_process: int
+    ) -> Iterator[list[tuple[str, str, str]]]:
+        tagger = self.tagger
+        for text in texts:
+            tokens = []
+            previous = ("", "", "")
+            for word in tagger(text):
+                feature = word.feature
+                orth_base = getattr(feature, "orthBase", None) or word.surface
+                # UniDic lemmas of loanwords carry the source word, e.g. "パン-pão"
+                norm = (getattr(feature, "lemma", None) or orth_base).split("-")[0]
+                pos = unidic_to_upos(feature.pos1, feature.pos2, orth_base, previous)
+                previous = (feature.pos1, feature.pos2, feature.pos3)
+                lemma = norm if pos == "VERB" else orth_base
+                keep = self.decisions.get((lemma, pos))
+                if keep is None:
+                    keep = self.decisions[(lemma, pos)] = is_vocab_token(lemma, pos)
+                if keep:
+                    tokens.append((lemma, norm, pos))
+                if debug:
+                    trace.emit("tokenizer", f"orth={word.surface} lemma={lemma} norm={norm} pos={pos} feature={feature}")
+            yield tokens
+
+
+backends = {
+    "electra": lambda: SpacyBackend('ja_ginza_electra'),
+    "ginza": lambda: SpacyBackend('ja_ginza'),
+    "fugashi": lambda: FugashiBackend(),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(name: str = "electra"):
+    try:
+        return backends[name]()
+    except KeyError:
+        raise ValueError(f"Unknown tokenizer {name}, expected one of: {', '.join(backends)}")
+
+
+def tokens_from_texts(
+        texts: Iterable[str],
+        debug: bool,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        backend: str = "electra",
+        use_cache: bool = True,
+) -> Iterator[tuple[str, str, str]]:
+    """Stream texts through the selected tokenizer backend in batches and yield (lemma, norm, pos) for every kept token."""
+    for tokens in tokens_per_text(texts, debug, batch_size, n_process, backend, use_cache):
+        yield from tokens
+
+
+def tokens_per_text(
+        texts: Iterable[str],
+        debug: bool,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        backend: str = "electra",
+        use_cache: bool = True,
+) -> Iterator[list[tuple[str, str, str]]]:
+    """
+    Yield the kept tokens of every text, in input order. Texts that were tokenized before are read
+    from the on-disk token cache; traced runs always go through the model so the trace is complete.
+    """
+    tokenizer_backend = get_backend(backend)
+    if debug or not use_cache:
+        yield from tokenizer_backend.analyze(texts, debug, batch_size, n_process)
+        return
+
+    cache = token_cache.get_token_cache()
+    namespace = f"{tokenizer_backend.cache_namespace}-filter{FILTER_VERSION}"
+    # Look texts up a few batches at a time so the model still sees full batches of misses
+    for block in itertools.batched(texts, batch_size * 4):
+        keys = [cache.key(namespace, text) for text in block]
+        found = cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, block) if key not in found}
+        if missing:
+            analyzed = zip(missing, tokenizer_backend.analyze(missing.values(), debug, batch_size, n_process))
+            fresh = dict(analyzed)
+            cache.put_many(fresh)
+            found.update(fresh)
+        for key in keys:
+            yield found[key]
+    cache.evict()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Standard library imports
+import multiprocessing.util
+import os
+import queue
+import threading
+from typing import Iterable
+
+# tokenizer: every token with its lemma, POS and parse; dictionary: how each word's entry was chosen
+subsystems = ["tokenizer", "dictionary"]
+
+_enabled = frozenset()
+_queue = None
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def parse_subsystems(value: str) -> list[str]:
+    """Parse a comma-separated list of subsystems, "all" meaning every one of them."""
+    names = [name.strip().lower() for name in value.split(",") if name.strip()]
+    if "all" in names:
+        return list(subsystems)
+    unknown = [name for name in names if name not in subsystems]
+    if unknown:
+        raise ValueError(f"Unknown trace subsystem(s): {', '.join(unknown)}. Choose from: {', '.join(subsystems)}, all")
+    return names
+
+
+def configure(enabled: Iterable[str]) -> None:
+    """Enable tracing for the given subsystems only. Worker processes call this from their initializer."""
+    global _enabled
+    _enabled = frozenset(enabled)
+
+
+def enabled_subsystems() -> list[str]:
+    return sorted(_enabled)
+
+
+def enabled(subsystem: str) -> bool:
+    """
+    Check before building a trace message, so nothing is formatted when the subsystem is not traced:
+    if trace.enabled("dictionary"): trace.emit("dictionary", f"...")
+    """
+    return subsystem in _enabled
+
+
+def emit(subsystem: str, message: str) -> None:
+    """Queue one line for trace.<subsystem>.<pid>.log. The file is written by a background thread."""
+    _get_queue().put((subsystem, message))
+
+
+def _get_queue() -> queue.SimpleQueue:
+    global _queue, _writer, _writer_pid
+    # Threads do not survive a fork, so each worker process starts its own writer
+    if _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer_pid != os.getpid():
+                _queue = queue.SimpleQueue()
+                _writer = threading.Thread(target=_write, args=(_queue,), name="trace-writer", daemon=True)
+                _writer.start()
+                _writer_pid = os.getpid()
+                # Unlike atexit handlers, multiprocessing finalizers also run when a worker process exits
+                multiprocessing.util.Finalize(None, flush, exitpriority=100)
+    return _queue
+
+
+def flush() -> None:
+    """Wait until everything queued so far is written and stop the writer."""
+    global _writer_pid
+    if _writer_pid != os.getpid():
+        return
+    with _writer_lock:
+        _queue.put(None)
+        _writer.join()
+        _writer_pid = None
+
+
+def _write(messages: queue.SimpleQueue) -> None:
+    files = {}
+    try:
+        while True:
+            item = messages.get()
+            # Write everything that is already queued before flushing
+            while item is not None:
+                subsystem, message = item
+                if subsystem not in files:
+                    files[subsystem] = open(f"trace.{subsystem}.{os.getpid()}.log", "w", encoding="utf-8")
+                files[subsystem].write(message + "\n")
+                try:
+                    item = messages.get_nowait()
+                except queue.Empty:
+                    break
+            for f in files.values():
+                f.flush()
+            if item is None:
+                return
+    finally:
+        for f in files.values():
+            f.close()
@@ -0,0 +1,85 @@
+import json
+import zipfile
+
+from sample import ocr, ocr_manifest
+
+
+def make_volume_zip(parent, name, pages):
+    with zipfile.ZipFile(parent / f"{name}.zip", "w") as archive:
+        for page in pages:
+            archive.writestr(page, b"image " + page.encode())
+
+
+def fake_mokuro(parent, volume_path):
+    """Do what mokuro does with a volume: extract an archive in place, then write page results and .mokuro."""
+    name = ocr_manifest.volume_name(volume_path)
+    if volume_path.is_file():
+        with zipfile.ZipFile(volume_path) as archive:
+            archive.extractall(parent / name)
+    pages = sorted(ocr_manifest.list_pages(parent / name))
+    for page in pages:
+        result_path = ocr_manifest.page_result_path(parent, name, page)
+        result_path.parent.mkdir(parents=True, exist_ok=True)
+        if not result_path.exists():
+            result_path.write_text(json.dumps({"blocks": [{"lines": [page]}]}), encoding="utf-8")
+    (parent / f"{name}.mokuro").write_text(
+        json.dumps({"pages": [{"img_path": page} for page in pages]}), encoding="utf-8"
+    )
+
+
+def run_ocr(parent):
+    volume_paths, pending = ocr.plan_ocr(parent, is_parent=True)
+    for volume_path in pending:
+        fake_mokuro(parent, volume_path)
+    for volume_path in volume_paths:
+        ocr_manifest.record_volume(parent, volume_path)
+    return volume_paths, pending
+
+
+def test_archive_extracted_in_place_is_one_volume(tmp_path):
+    make_volume_zip(tmp_path, "Vol", ["001.jpg", "002.jpg", "003.jpg"])
+
+    volume_paths, pending = run_ocr(tmp_path)
+    assert volume_paths == pending == [tmp_path / "Vol.zip"]
+    assert (tmp_path / "Vol").is_dir()
+
+    # The extracted folder is what mokuro reads from now on, and its results are reused
+    for _ in range(2):
+        volume_paths, pending = run_ocr(tmp_path)
+        assert volume_paths == [tmp_path / "Vol"]
+        assert pending == []
+    assert len(list((tmp_path / "_ocr" / "Vol").glob("*.json"))) == 3
+    assert len(json.loads((tmp_path / "Vol.mokuro").read_text(encoding="utf-8"))["pages"]) == 3
+
+
+def test_changed_page_of_extracted_archive_is_ocred_again(tmp_path):
+    make_volume_zip(tmp_path, "Vol", ["001.jpg", "002.jpg"])
+    run_ocr(tmp_path)
+    run_ocr(tmp_path)
+
+    (tmp_path / "Vol" / "002.jpg").write_bytes(b"another image")
+    _, pending = ocr.plan_ocr(tmp_path, is_parent=True)
+    assert pending == [tmp_path / "Vol"]
+    assert ocr_manifest.page_result_path(tmp_path, "Vol", "001.jpg").is_file()
+    assert not ocr_manifest.page_result_path(tmp_path, "Vol", "002.jpg").is_file()
+
+
+def test_volumes_in_mokuro_order_without_duplicates(tmp_path):
+    for name in ["Vol 10", "Vol 2", "Vol 1"]:
+        make_volume_zip(tmp_path, name, ["001.jpg"])
+    (tmp_path / "Vol 2").mkdir()
+    (tmp_path / "_ocr").mkdir()
+
+    assert ocr.find_manga_volumes(tmp_path) == [tmp_path / "Vol 1.zip", tmp_path / "Vol 2", tmp_path / "Vol 10.zip"]
+
+
+def test_ocr_pages_are_read_in_natural_order(tmp_path):
+    pages = tmp_path / "_ocr" / "Vol"
+    (pages / "ch10").mkdir(parents=True)
+    (pages / "ch2").mkdir()
+    for page in ["ch2/1.json", "ch2/10.json", "ch2/2.json", "ch10/1.json"]:
+        (pages / page).write_text("{}", encoding="utf-8")
+
+    assert ocr.index_ocr_folder(tmp_path / "_ocr") == {
+        "Vol": [pages / "ch2" / "1.json", pages / "ch2" / "2.json", pages / "ch2" / "10.json", pages / "ch10" / "1.json"]
+    }
@@ -0,0 +1,47 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from sample import ocr, ocr_manifest, page_triage
+
+
+def save_page(path, seed=None):
+    page = np.full((400, 300), 250, np.uint8)
+    if seed is not None:
+        rng = np.random.default_rng(seed)
+        for _ in range(30):
+            y, x = rng.integers(0, 380), rng.integers(0, 280)
+            page[y:y + rng.integers(5, 40), x:x + rng.integers(5, 40)] = 0
+    Image.fromarray(page).save(path)
+
+
+def test_triage_skips_blank_and_duplicate_pages_until_turned_off(tmp_path):
+    volume = tmp_path / "Vol"
+    volume.mkdir()
+    save_page(volume / "001.png", seed=1)
+    save_page(volume / "002.png")
+    save_page(volume / "003.png", seed=1)
+    (volume / "004.png").write_bytes(b"not an image")
+
+    ocr.set_page_triage(True)
+    try:
+        ocr.plan_ocr(volume, is_parent=False)
+    finally:
+        ocr.set_page_triage(False)
+    skipped = {
+        page for page in ocr_manifest.list_pages(volume)
+        if ocr_manifest.page_result_path(tmp_path, "Vol", page).is_file()
+    }
+    assert skipped == {"002.png", "003.png"}
+
+    _, pending = ocr.plan_ocr(volume, is_parent=False)
+    assert pending == [volume]
+    assert not any((tmp_path / "_ocr" / "Vol").glob("*.json"))
+
+
+def test_page_with_one_short_line_is_not_blank(tmp_path):
+    for suffix in (".png", ".jpg"):
+        page = Image.new("L", (1100, 1600), 255)
+        ImageDraw.Draw(page).text((440, 340), "A", fill=0, font=ImageFont.load_default(size=30))
+        page.save(tmp_path / f"001{suffix}")
+
+        assert page_triage.triage_pages([tmp_path / f"001{suffix}"]) == {}
@@ -0,0 +1,17 @@
+from sample import tokenizer
+
+
+def fugashi_vocab(text):
+    vocab, _ = tokenizer.vocab_from_texts([text], False, False, backend="fugashi", use_cache=False)
+    return [lemma for lemma, _, _ in vocab]
+
+
+def test_fugashi_drops_helper_verbs():
+    vocab = fugashi_vocab("毎日日本語を勉強しています。本を読んでしまった。書いてある。行ってみる。")
+
+    assert {"勉強", "読む", "書く", "行く"} <= set(vocab)
+    assert not {"為る", "居る", "仕舞う", "有る", "見る"} & set(vocab)
+
+
+def test_fugashi_keeps_independent_verbs():
+    assert {"居る", "有る"} <= set(fugashi_vocab("猫がいる。本がある。"))